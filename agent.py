@@ -8,6 +8,7 @@ from memory import Memory
 from characters import get_character
 from llm_provider import get_provider, list_available_providers
 from relationship import Relationship
+from file_utils import safe_name, atomic_write_bytes
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -41,6 +42,8 @@ class CharacterAgent:
         
         self.character_name = character_name
         self.user_id = user_id
+        # Шаблон для поиска прямых обращений к персонажу
+        self._name_re = re.compile(rf'\b{re.escape(character_name)}\b', re.IGNORECASE)
         print(f"Инициализация агента {character_name} для пользователя {user_id}...")
         
         # Сохраняем параметры
@@ -50,13 +53,11 @@ class CharacterAgent:
         self.style_level = style_level
         self.custom_style_examples = custom_style_examples or []
         
-        # Формируем безопасное имя файла из имени персонажа и ID пользователя
-        safe_character = "".join(c if c.isalnum() else "_" for c in character_name)
-        safe_user = "".join(c if c.isalnum() else "_" for c in user_id)
-        self.state_dir = os.path.join("character_states", safe_character, safe_user)
+        self.state_dir = self.get_state_dir(character_name, user_id)
         self.memory_file = os.path.join(self.state_dir, "memory.pkl")
         self.style_file = os.path.join(self.state_dir, "custom_style_examples.json")
         self.relationship_file = os.path.join(self.state_dir, "relationship.json")
+        self.relationship_history_file = os.path.join(self.state_dir, "relationship_history.jsonl")
         
         # Создаем директорию для состояния, если она не существует
         os.makedirs(self.state_dir, exist_ok=True)
@@ -115,8 +116,9 @@ class CharacterAgent:
             # Загружаем существующие отношения
             try:
                 with open(self.relationship_file, 'r', encoding='utf-8') as f:
-                    relationship_data = json.load(f)
-                self.relationship = Relationship.from_dict(relationship_data)
+                    self.relationship = Relationship.loads(
+                        f.read(), history_path=self.relationship_history_file
+                    )
                 print(f"Загружены отношения персонажа {self.character_name} к пользователю {self.user_id}")
             except Exception as e:
                 print(f"Ошибка при загрузке отношений: {str(e)}")
@@ -149,7 +151,8 @@ class CharacterAgent:
             character_name=self.character_name,
             initial_rapport=initial_rapport,
             initial_aspects=initial_aspects,
-            personality_factors=personality_factors
+            personality_factors=personality_factors,
+            history_path=self.relationship_history_file
         )
         
         print(f"Созданы новые отношения персонажа {self.character_name} к пользователю {self.user_id}")
@@ -159,8 +162,10 @@ class CharacterAgent:
         Сохраняет текущие отношения в файл
         """
         try:
-            with open(self.relationship_file, 'w', encoding='utf-8') as f:
-                json.dump(self.relationship.to_dict(), f, ensure_ascii=False, indent=2)
+            # Отношения сохраняются после каждого взаимодействия, поэтому без отступов
+            # и через Relationship.dumps (orjson, если он установлен)
+            # Запись через временный файл: при сбое остается предыдущая версия отношений
+            atomic_write_bytes(self.relationship_file, self.relationship.dumps().encode('utf-8'))
             return True
         except Exception as e:
             print(f"Ошибка при сохранении отношений: {str(e)}")
@@ -237,13 +242,16 @@ class CharacterAgent:
             'опасность': ['опасно', 'угроза', 'риск', 'предупреждаю', 'осторожно', 'берегись']
         }
         
+        # Приводим тексты к нижнему регистру один раз (ключевые слова уже в нижнем регистре)
+        user_text = user_message.lower()
+        
         # Объединяем сообщение и ответ для анализа
-        full_interaction = f"{user_message} {character_response}".lower()
+        full_interaction = f"{user_text} {character_response.lower()}"
         
         # Проверяем на наличие ключевых слов, указывающих на важность
         importance_score = 0.0
         for keyword in important_keywords:
-            if keyword.lower() in full_interaction:
+            if keyword in full_interaction:
                 importance_score += 0.1  # Увеличиваем оценку за каждое ключевое слово
         
         # Ограничиваем важность диапазоном 0.3-0.9
@@ -258,7 +266,7 @@ class CharacterAgent:
         emotion = None
         for emotion_name, keywords in emotional_keywords.items():
             for keyword in keywords:
-                if keyword.lower() in full_interaction:
+                if keyword in full_interaction:
                     emotion = emotion_name
                     # Эмоциональные взаимодействия часто важнее
                     importance_score = min(0.9, importance_score + 0.1)
@@ -270,7 +278,7 @@ class CharacterAgent:
         category = None
         for cat_name, keywords in categories.items():
             for keyword in keywords:
-                if keyword.lower() in full_interaction:
+                if keyword in full_interaction:
                     category = cat_name
                     break
             if category:
@@ -281,7 +289,7 @@ class CharacterAgent:
         is_important = importance_score >= 0.4 or total_length > 300
         
         # Вопросы о персонаже часто важны
-        if self.character_name.lower() in user_message.lower():
+        if self.character_name.lower() in user_text:
             is_important = True
             importance_score = max(importance_score, 0.5)
             if not category:
@@ -298,12 +306,12 @@ class CharacterAgent:
             is_important = True
         
         # Если взаимодействие содержит прямое обращение к персонажу, оно важнее
-        if re.search(rf'\b{self.character_name}\b', user_message, re.IGNORECASE):
+        if self._name_re.search(user_message):
             importance_score = min(0.9, importance_score + 0.1)
             is_important = True
         
         # Игнорируем служебные сообщения или сообщения об изменении отношений
-        if "[Ручное изменение отношения]" in user_message or "изменение отношений" in user_message.lower():
+        if "[Ручное изменение отношения]" in user_message or "изменение отношений" in user_text:
             is_important = False
         
         # Проверяем на очень короткие сообщения с малой информационной ценностью
@@ -429,29 +437,31 @@ class CharacterAgent:
             self.style_level
         )
         
-        # Дополнительные инструкции по отношениям
-        relationship_status = self.relationship.get_status_description()
+        # Дополнительные инструкции по отношениям: нужны только числовые значения,
+        # поэтому текстовые описания get_status_description не строятся
+        rapport = self.relationship.rapport
+        aspect_values = self.relationship.aspects
         
         # Добавляем инструкции об отношениях в зависимости от их уровня
         relationship_instructions = "\n\nТвои ответы должны отражать твое текущее отношение к собеседнику. "
         
-        if relationship_status['rapport_value'] > 0.7:
+        if rapport > 0.7:
             relationship_instructions += "Ты очень хорошо относишься к собеседнику, проявляй дружелюбие и готовность помочь."
-        elif relationship_status['rapport_value'] > 0.3:
+        elif rapport > 0.3:
             relationship_instructions += "Ты положительно относишься к собеседнику, будь доброжелателен."
-        elif relationship_status['rapport_value'] > -0.3:
+        elif rapport > -0.3:
             relationship_instructions += "Ты нейтрально относишься к собеседнику, будь вежлив, но сдержан."
-        elif relationship_status['rapport_value'] > -0.7:
+        elif rapport > -0.7:
             relationship_instructions += "Ты плохо относишься к собеседнику, проявляй сдержанное раздражение и нетерпение."
         else:
             relationship_instructions += "Ты очень плохо относишься к собеседнику, будь холоден и демонстрируй явное неодобрение."
         
         # Добавляем инструкции по аспектам отношений
-        if relationship_status['aspect_values'].get('trust', 0) < -0.5:
+        if aspect_values.get('trust', 0) < -0.5:
             relationship_instructions += " Ты не доверяешь собеседнику, будь осторожен и подозрителен."
-        if relationship_status['aspect_values'].get('respect', 0) < -0.5:
+        if aspect_values.get('respect', 0) < -0.5:
             relationship_instructions += " Ты не уважаешь собеседника, можешь проявлять снисходительность."
-        if relationship_status['aspect_values'].get('patience', 0) < -0.5:
+        if aspect_values.get('patience', 0) < -0.5:
             relationship_instructions += " Твое терпение на исходе, ты можешь обрывать собеседника и отвечать короче."
         
         system_content += relationship_instructions
@@ -661,29 +671,7 @@ class CharacterAgent:
             bool: True если обновление успешно, False в противном случае
         """
         try:
-            if aspect == 'rapport':
-                old_value = self.relationship.rapport
-                self.relationship.rapport = max(-1.0, min(1.0, old_value + change))
-                
-                # Добавляем в историю
-                self.relationship._add_to_history(
-                    "Ручное изменение общего отношения", 
-                    self.relationship.rapport, 
-                    self.relationship.aspects,
-                    abs(change)
-                )
-            elif aspect in self.relationship.aspects:
-                old_value = self.relationship.aspects[aspect]
-                self.relationship.aspects[aspect] = max(-1.0, min(1.0, old_value + change))
-                
-                # Добавляем в историю
-                self.relationship._add_to_history(
-                    f"Ручное изменение аспекта {aspect}", 
-                    self.relationship.rapport, 
-                    self.relationship.aspects,
-                    abs(change)
-                )
-            else:
+            if not self.relationship.update_aspect(aspect, change):
                 return False
             
             # Сохраняем обновленные отношения
@@ -759,6 +747,21 @@ class CharacterAgent:
             print(f"Ошибка при инициализации LLM: {str(e)}")
             return False
 
+    @staticmethod
+    def get_state_dir(character_name, user_id):
+        """
+        Директория состояния агента для пары персонаж-пользователь
+        
+        Args:
+            character_name (str): Имя персонажа
+            user_id (str): Идентификатор пользователя
+            
+        Returns:
+            str: Путь к директории состояния
+        """
+        # Формируем безопасное имя файла из имени персонажа и ID пользователя
+        return os.path.join("character_states", safe_name(character_name), safe_name(user_id))
+    
     @classmethod
     def load_or_create(cls, character_name, user_id="default", model_name='paraphrase-multilingual-MiniLM-L12-v2', 
                        index_type='flat', use_cosine=True, style_level='high',
@@ -780,11 +783,7 @@ class CharacterAgent:
         Returns:
             CharacterAgent: Загруженный или новый агент
         """
-        # Формируем безопасное имя файла из имени персонажа и ID пользователя
-        safe_character = "".join(c if c.isalnum() else "_" for c in character_name)
-        safe_user = "".join(c if c.isalnum() else "_" for c in user_id)
-        state_dir = os.path.join("character_states", safe_character, safe_user)
-        memory_file = os.path.join(state_dir, "memory.pkl")
+        memory_file = os.path.join(cls.get_state_dir(character_name, user_id), "memory.pkl")
         
         if os.path.exists(memory_file):
             print(f"Найдено состояние агента {character_name} для пользователя {user_id}")
@@ -0,0 +1,72 @@
+# file_utils.py
+
+"""
+Вспомогательные функции для работы с файлами состояния.
+Модуль не зависит от остальных частей проекта, поэтому его можно импортировать
+и из легких скриптов (например, setup_directories.py).
+"""
+
+import os
+import re
+import functools
+
+# Символы, недопустимые в именах файлов и директорий (все, кроме букв и цифр; "_" остается "_")
+_UNSAFE_CHARS_RE = re.compile(r'\W')
+
+
+@functools.lru_cache(maxsize=1024)
+def safe_name(name):
+    """
+    Формирует безопасное имя файла (результат кэшируется: имена персонажей
+    и пользователей повторяются при каждом создании агента)
+    
+    Args:
+        name (str): Исходное имя
+        
+    Returns:
+        str: Имя, в котором все символы, кроме букв и цифр, заменены на "_"
+    """
+    return _UNSAFE_CHARS_RE.sub("_", name)
+
+
+def atomic_write(path, write):
+    """
+    Атомарная запись файла: данные пишутся во временный файл рядом, сбрасываются
+    на диск и затем подменяют исходный. При сбое временный файл удаляется, а
+    исходный остается нетронутым (отображения в память старого файла тоже
+    остаются корректными)
+    
+    Args:
+        path (str): Путь к файлу
+        write (Callable[[str], None]): Функция, записывающая данные по переданному пути
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        write(tmp_path)
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_bytes(path, data):
+    """
+    Атомарно записывает байты в файл (см. atomic_write)
+    
+    Args:
+        path (str): Путь к файлу
+        data (bytes): Данные для сохранения
+    """
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    
+    atomic_write(path, write)
@@ -37,10 +37,12 @@ class LongTermMemory(BaseMemory):
         self.memory["traits"] = character_data.get("traits", [])
         self.memory["speech_patterns"] = character_data.get("speech_patterns", [])
         
-        # Создаем индексы для каждого типа памяти
-        for memory_type in ["facts", "traits", "speech_patterns"]:
-            if self.memory[memory_type]:
-                self.vector_index.create_index(memory_type, self.memory[memory_type])
+        # Создаем индексы для всех типов памяти одним проходом модели
+        self.vector_index.create_indexes({
+            memory_type: self.memory[memory_type]
+            for memory_type in ["facts", "traits", "speech_patterns"]
+            if self.memory[memory_type]
+        })
         
         # Возвращаем тексты для совместимости
         return {
@@ -109,19 +111,19 @@ class LongTermMemory(BaseMemory):
         """
         relevant_memories = {}
         
-        for memory_type in memory_types:
-            if memory_type in self.memory and self.memory[memory_type]:
-                # Поиск в индексе
-                results = self.vector_index.search(
-                    memory_type, query, top_k, relevance_method, min_relevance
-                )
-                
-                # Если есть результаты, добавляем их
-                if results:
-                    relevant_memories[memory_type] = [
-                        {"text": r["text"], "relevance": r["relevance"]} 
-                        for r in results
-                    ]
+        # Поиск во всех индексах с одним эмбеддингом запроса
+        search_types = [mt for mt in memory_types if mt in self.memory and self.memory[mt]]
+        results_by_type = self.vector_index.search_multi(
+            search_types, query, top_k, relevance_method, min_relevance
+        )
+        
+        for memory_type, results in results_by_type.items():
+            # Если есть результаты, добавляем их
+            if results:
+                relevant_memories[memory_type] = [
+                    {"text": r["text"], "relevance": r["relevance"]} 
+                    for r in results
+                ]
         
         return relevant_memories
     
@@ -143,7 +145,10 @@ class LongTermMemory(BaseMemory):
         """
         for memory_type in ["facts", "traits", "speech_patterns"]:
             self.memory[memory_type] = data.get(memory_type, [])
-            
-            # Пересоздаем индексы
-            if self.memory[memory_type]:
-                self.vector_index.rebuild_index(memory_type, self.memory[memory_type])
\ No newline at end of file
+        
+        # Пересоздаем индексы
+        self.vector_index.rebuild_indexes({
+            memory_type: self.memory[memory_type]
+            for memory_type in ["facts", "traits", "speech_patterns"]
+            if self.memory[memory_type]
+        })
\ No newline at end of file
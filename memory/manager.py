@@ -11,6 +11,7 @@ from .episodic import EpisodicMemory
 from .long_term import LongTermMemory
 from .short_term import ShortTermMemory
 from .vector_index import VectorIndex
+from file_utils import atomic_write_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -125,6 +126,11 @@ class MemoryManager:
         """
         return self.episodic_memory.clear()  # Вызываем метод EpisodicMemory
     
+    @staticmethod
+    def _index_dir(file_path):
+        """Директория с файлами векторных индексов для файла памяти"""
+        return os.path.splitext(file_path)[0] + "_index"
+    
     def save_to_file(self, file_path):
         """Сохранение состояния памяти в файл"""
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -139,8 +145,11 @@ class MemoryManager:
             'use_cosine': self.use_cosine
         }
         
-        with open(file_path, 'wb') as f:
-            pickle.dump(memory_data, f)
+        # Запись через временный файл: при сбое остается предыдущая версия памяти
+        atomic_write_bytes(file_path, pickle.dumps(memory_data))
+        
+        # Индексы сохраняем рядом, чтобы при загрузке не кодировать тексты заново
+        self.vector_index.save(self._index_dir(file_path))
         
         logger.info(f"Память успешно сохранена в {file_path}")
     
@@ -162,6 +171,14 @@ class MemoryManager:
                 use_cosine=memory_data.get('use_cosine', True)
             )
             
+            # Загружаем сохраненные индексы: восстановление компонентов ниже
+            # увидит те же тексты и не будет перекодировать их. Поврежденные индексы
+            # не должны приводить к потере памяти: компоненты перестроят их по текстам
+            try:
+                manager.vector_index.load(cls._index_dir(file_path))
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить индексы памяти, они будут перестроены: {str(e)}")
+            
             # Восстанавливаем компоненты
             manager.long_term_memory.from_dict(memory_data.get('long_term_memory', {}))
             manager.short_term_memory.from_dict(memory_data.get('short_term_memory', {}))
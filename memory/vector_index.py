@@ -1,20 +1,161 @@
 # memory/vector_index.py
 
+import os
+import functools
+import pickle
+import threading
+import time
+from array import array
 import numpy as np
 import faiss
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 import logging
 
+from file_utils import atomic_write
+
+# torch, sentence-transformers и transformers импортируются при загрузке модели:
+# загрузка, поиск и сохранение готовых индексов обходятся без них
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+try:
+    from numba import njit
+except ImportError:  # Numba необязательна: без нее используется NumPy
+    njit = None
+
 logger = logging.getLogger(__name__)
 
+# Коды методов расчета релевантности для JIT-ядра
+_RELEVANCE_METHODS = {'inverse': 0, 'exponential': 1, 'sigmoid': 2}
+
+
+def _score_kernel(distances, indices, n_texts, method_code, min_relevance):
+    """
+    Расчет релевантности и фильтрация результатов поиска одним проходом
+    
+    Args:
+        distances (np.ndarray): Матрица расстояний (n_queries, k)
+        indices (np.ndarray): Матрица идентификаторов (n_queries, k)
+        n_texts (int): Количество текстов в индексе
+        method_code (int): Код метода из _RELEVANCE_METHODS
+        min_relevance (float): Минимальное значение релевантности
+        
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Матрица релевантности и маска прошедших фильтр
+    """
+    relevances = np.empty(distances.shape, dtype=np.float64)
+    mask = np.zeros(distances.shape, dtype=np.bool_)
+    for i in range(distances.shape[0]):
+        for j in range(distances.shape[1]):
+            distance = distances[i, j]
+            if method_code == 1:
+                relevance = np.exp(-distance)
+            elif method_code == 2:
+                relevance = 1.0 / (1.0 + np.exp(5.0 * (distance - 1.0)))
+            else:
+                relevance = 1.0 / (1.0 + distance)
+            relevances[i, j] = relevance
+            idx = indices[i, j]
+            mask[i, j] = idx >= 0 and idx < n_texts and relevance >= min_relevance
+    return relevances, mask
+
+
+if njit is not None:
+    _score_kernel = njit(cache=True, fastmath=True)(_score_kernel)
+
+
+def _save_npy(path: str, array_np: np.ndarray) -> None:
+    """Сохранение массива в .npy по точному пути (np.save с именем файла добавил бы расширение)"""
+    with open(path, 'wb') as f:
+        np.save(f, array_np)
+
+
+def _save_pickle(path: str, data: Any) -> None:
+    """Сохранение объекта через pickle"""
+    with open(path, 'wb') as f:
+        pickle.dump(data, f)
+
+
+class TextStore:
+    """
+    Компактное хранилище текстов индекса: все тексты лежат в одном буфере UTF-8,
+    а границы задаются массивом смещений
+    """
+    
+    def __init__(self, texts: List[str] = ()):
+        """
+        Инициализация хранилища
+        
+        Args:
+            texts (List[str]): Начальные тексты
+        """
+        self.blob = bytearray()
+        self.offsets = array('q', [0])
+        self.extend(texts)
+    
+    def extend(self, texts: List[str]) -> None:
+        """
+        Добавление текстов в конец хранилища
+        
+        Args:
+            texts (List[str]): Новые тексты
+        """
+        for text in texts:
+            self.blob += text.encode('utf-8')
+            self.offsets.append(len(self.blob))
+    
+    def take(self, ids: np.ndarray) -> List[str]:
+        """
+        Получение текстов по массиву идентификаторов
+        
+        Args:
+            ids (np.ndarray): Идентификаторы (позиции) текстов
+            
+        Returns:
+            List[str]: Тексты в порядке идентификаторов
+        """
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        starts = offsets[ids]
+        ends = offsets[ids + 1]
+        return [self.blob[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, idx: int) -> str:
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].decode('utf-8')
+    
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
 class VectorIndex:
     """
     Класс для создания и управления векторными индексами FAISS
     """
     
+    # Загруженные модели общие для всех индексов процесса (агентов разных пользователей):
+    # (model_name, backend, dtype) -> модель
+    _shared_models: Dict[tuple, 'SentenceTransformer'] = {}
+    _shared_models_lock = threading.Lock()
+    
+    # Число потоков, одновременно кодирующих тексты и ищущих по индексам (например,
+    # рабочих потоков SessionManager). Потоки torch и FAISS по умолчанию делятся
+    # между ними, чтобы не занимать одни и те же ядра
+    concurrency = 1
+    
+    # Потоки OpenMP FAISS задаются для процесса один раз, при создании первого индекса
+    _faiss_threads_configured = False
+    
+    # Минимальное число векторов для каждого типа индекса; на меньших объемах строится Flat
+    MIN_VECTORS = {'ivf': 1000, 'ivfpq': 10000, 'hnsw': 1000}
+    
     def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2', 
-                index_type='flat', use_cosine=True):
+                index_type='flat', use_cosine=True, query_cache_size=512, dtype='float32',
+                gpu_min_vectors=5000, encode_batch_size=64, backend='torch',
+                nlist=None, nprobe=None, hnsw_m=32, ef_construction=100, ef_search=64,
+                faiss_threads=None, torch_threads=None):
         """
         Инициализация векторного индекса
         
@@ -22,19 +163,224 @@ class VectorIndex:
             model_name (str): Название модели sentence-transformers
             index_type (str): Тип индекса FAISS ('flat', 'ivf', 'ivfpq', 'hnsw')
             use_cosine (bool): Использовать ли косинусное сходство вместо евклидова расстояния
+            query_cache_size (int): Размер LRU-кэша эмбеддингов запросов
+            dtype (str): Точность весов модели ('float32', 'float16', 'bfloat16', 'qint8')
+            gpu_min_vectors (int): Минимальный размер индекса для переноса на GPU
+            encode_batch_size (int): Размер батча при кодировании текстов для индекса
+            backend (str): Движок инференса модели ('torch', 'onnx', 'openvino')
+            nlist (int, optional): Число кластеров IVF (по умолчанию подбирается по размеру данных)
+            nprobe (int, optional): Число проверяемых кластеров IVF при поиске
+            hnsw_m (int): Число исходящих связей в графе HNSW
+            ef_construction (int): Ширина поиска HNSW при построении графа
+            ef_search (int): Ширина поиска HNSW при запросах
+            faiss_threads (int, optional): Число потоков OpenMP для FAISS, задается при создании первого индекса
+                (по умолчанию min(8, CPU / concurrency))
+            torch_threads (int, optional): Число потоков torch, задается при загрузке первой модели
+                (по умолчанию CPU / concurrency)
         """
         self.model_name = model_name
         self.index_type = index_type
         self.use_cosine = use_cosine
+        self.dtype = dtype
+        self.gpu_min_vectors = gpu_min_vectors
+        self.encode_batch_size = encode_batch_size
+        self.backend = backend
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
         
-        # Загрузка модели для создания эмбеддингов
-        logger.info(f"Загрузка модели {model_name}...")
-        self.model = SentenceTransformer(model_name)
-        logger.info("Модель успешно загружена")
+        if backend != 'torch' and dtype != 'float32':
+            raise ValueError(f"Точность {dtype} поддерживается только для backend='torch'")
+        
+        # Ядра делятся между потоками, одновременно работающими с индексами
+        threads_per_caller = max(1, (os.cpu_count() or 1) // max(1, VectorIndex.concurrency))
+        self.torch_threads = torch_threads or threads_per_caller
+        
+        # Ограничиваем OpenMP FAISS: при пакетном поиске больше потоков упираются в барьеры
+        with VectorIndex._shared_models_lock:
+            if not VectorIndex._faiss_threads_configured:
+                faiss.omp_set_num_threads(faiss_threads or min(8, threads_per_caller))
+                VectorIndex._faiss_threads_configured = True
+        
+        # Ресурсы GPU создаются только при первом переносе индекса
+        self._gpu_resources = None
+        
+        # Эмбеддинги проиндексированных текстов: буфер с запасом емкости и число занятых строк
+        self._embeddings = {}
+        self._sizes = {}
+        
+        # Обученные квантайзеры IVF по типам памяти: (квантайзер, размер обучающей выборки);
+        # для IVFPQ квантайзер не переиспользуется и хранится только размер выборки (None вместо квантайзера)
+        self._trained_quantizers = {}
+        
+        # Индексы, загруженные через mmap только для чтения: тип памяти -> путь к файлу
+        self._mmap_paths = {}
+        
+        # Директории, в которых лежит актуальная копия индекса: тип памяти -> директория.
+        # Изменение индекса удаляет запись, и save перезаписывает только такие индексы
+        self._saved_to = {}
+        self._meta_saved_to = None
+        
+        # Модель для создания эмбеддингов загружается при первом обращении
+        # (или берется уже загруженная другим индексом, см. _shared_models)
+        self._model = None
         
         # Словари для хранения индексов и текстов
         self.indexes = {}
         self.texts = {}
+        
+        # Кэш эмбеддингов запросов: один и тот же запрос ищется сразу по нескольким
+        # типам памяти, поэтому повторный прогон модели не нужен
+        self._encode_query = functools.lru_cache(maxsize=query_cache_size)(self._encode_query_uncached)
+    
+    @property
+    def model(self) -> 'SentenceTransformer':
+        """
+        Модель sentence-transformers, загружаемая лениво при первом кодировании.
+        Веса одной модели загружаются в процесс один раз и разделяются всеми индексами
+        
+        Returns:
+            SentenceTransformer: Загруженная модель
+        """
+        if self._model is None:
+            key = (self.model_name, self.backend, self.dtype)
+            with VectorIndex._shared_models_lock:
+                model = VectorIndex._shared_models.get(key)
+                if model is None:
+                    model = self._load_model()
+                    VectorIndex._shared_models[key] = model
+            self._model = model
+        return self._model
+    
+    def _load_model(self) -> 'SentenceTransformer':
+        """
+        Загрузка модели sentence-transformers с выбранным движком и точностью
+        
+        Returns:
+            SentenceTransformer: Загруженная модель
+        """
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
+        logger.info(f"Загрузка модели {self.model_name} (backend: {self.backend})...")
+        
+        # Потоки torch задаются для процесса один раз, при загрузке первой модели, а не
+        # при импорте модуля. Один межоператорный поток исключает переподписку ядер
+        if not VectorIndex._shared_models:
+            torch.set_num_threads(self.torch_threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Уже задано или параллельная работа уже началась
+                pass
+        
+        if self.backend == 'torch':
+            model = SentenceTransformer(self.model_name)
+        else:
+            # ONNX Runtime / OpenVINO: модель экспортируется автоматически при первой загрузке
+            model = SentenceTransformer(self.model_name, backend=self.backend)
+        
+        self._ensure_fast_tokenizer(model)
+        model = self._apply_dtype(model, self.dtype)
+        logger.info("Модель успешно загружена")
+        return model
+    
+    @staticmethod
+    def _ensure_fast_tokenizer(model: 'SentenceTransformer') -> None:
+        """
+        Замена медленного Python-токенизатора на быстрый (Rust) токенизатор HuggingFace
+        
+        Args:
+            model (SentenceTransformer): Загруженная модель
+        """
+        from transformers import AutoTokenizer, PreTrainedTokenizerFast
+        
+        tokenizer = getattr(model, 'tokenizer', None)
+        if tokenizer is None or isinstance(tokenizer, PreTrainedTokenizerFast):
+            return
+        
+        try:
+            model.tokenizer = AutoTokenizer.from_pretrained(tokenizer.name_or_path, use_fast=True)
+            logger.info("Используется быстрый токенизатор")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось загрузить быстрый токенизатор: {str(e)}")
+    
+    @staticmethod
+    def _apply_dtype(model: 'SentenceTransformer', dtype: str) -> 'SentenceTransformer':
+        """
+        Перевод модели в пониженную точность
+        
+        Args:
+            model (SentenceTransformer): Загруженная модель
+            dtype (str): Точность весов ('float32', 'float16', 'bfloat16', 'qint8')
+            
+        Returns:
+            SentenceTransformer: Модель в выбранной точности
+        """
+        if dtype == 'float32':
+            return model
+        
+        import torch
+        
+        if dtype == 'bfloat16':
+            # Для GPU Ampere и новее: вдвое меньше трафика весов
+            return model.to(dtype=torch.bfloat16)
+        elif dtype == 'float16':
+            return model.half()
+        elif dtype == 'qint8':
+            # Динамическая int8-квантизация линейных слоев (только CPU)
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            raise ValueError(f"Неподдерживаемая точность модели: {dtype}")
+    
+    def _encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """
+        Создание эмбеддингов текстов в float32, который требуется для FAISS
+        
+        При косинусном сходстве векторы нормализуются внутри энкодера,
+        поэтому отдельный проход faiss.normalize_L2 не нужен.
+        
+        Args:
+            texts (List[str]): Тексты для кодирования
+            **kwargs: Дополнительные параметры для SentenceTransformer.encode
+            
+        Returns:
+            np.ndarray: Матрица эмбеддингов формы (len(texts), dimension)
+        """
+        # SentenceTransformer.encode сам сортирует тексты по длине перед разбиением
+        # на батчи и восстанавливает исходный порядок, поэтому паддинг минимален
+        # без дополнительной сортировки здесь
+        kwargs.setdefault('batch_size', min(len(texts), self.encode_batch_size) or 1)
+        kwargs.setdefault('normalize_embeddings', self.use_cosine)
+        kwargs.setdefault('show_progress_bar', False)
+        
+        import torch
+        
+        # Без autograd: не создаются буферы для обратного прохода
+        with torch.inference_mode():
+            if self.dtype in ('float16', 'bfloat16'):
+                # Пулинг выполняется в пониженной точности, в float32 переводим только результат
+                embeddings = self.model.encode(texts, convert_to_tensor=True, **kwargs)
+                return embeddings.float().cpu().numpy()
+            
+            embeddings = self.model.encode(texts, convert_to_numpy=True, convert_to_tensor=False, **kwargs)
+        
+        # Без копирования, если массив уже float32 и непрерывный
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _encode_query_uncached(self, query: str) -> np.ndarray:
+        """
+        Создание эмбеддинга запроса, готового для поиска в FAISS
+        
+        Args:
+            query (str): Текст запроса
+            
+        Returns:
+            np.ndarray: Вектор запроса формы (1, dimension) в float32
+        """
+        return self._encode([query])
     
     def create_index(self, memory_type: str, texts: List[str]) -> None:
         """
@@ -49,20 +395,52 @@ class VectorIndex:
             return
         
         # Создаем эмбеддинги
-        embeddings = self.model.encode(texts)
-        embeddings_np = np.array(embeddings).astype('float32')
+        embeddings_np = self._encode(texts)
         
+        self._build_index(memory_type, texts, embeddings_np)
+    
+    def create_indexes(self, texts_by_type: Dict[str, List[str]]) -> None:
+        """
+        Создание индексов сразу для нескольких типов памяти
+        
+        Все тексты кодируются одним вызовом модели, после чего матрица
+        эмбеддингов нарезается по типам памяти.
+        
+        Args:
+            texts_by_type (Dict[str, List[str]]): Тексты для индексации по типам памяти
+        """
+        memory_types = [mt for mt, texts in texts_by_type.items() if texts]
+        for memory_type in texts_by_type:
+            if memory_type not in memory_types:
+                logger.warning(f"Не удалось создать индекс для {memory_type}: пустой список текстов")
+        
+        if not memory_types:
+            return
+        
+        all_texts = [text for mt in memory_types for text in texts_by_type[mt]]
+        embeddings_np = self._encode(all_texts)
+        
+        offset = 0
+        for memory_type in memory_types:
+            texts = texts_by_type[memory_type]
+            self._build_index(memory_type, texts, embeddings_np[offset:offset + len(texts)])
+            offset += len(texts)
+    
+    def _build_index(self, memory_type: str, texts: List[str], embeddings_np: np.ndarray) -> None:
+        """
+        Построение индекса FAISS по готовым эмбеддингам
+        
+        Args:
+            memory_type (str): Тип памяти
+            texts (List[str]): Тексты, соответствующие эмбеддингам
+            embeddings_np (np.ndarray): Эмбеддинги текстов (float32)
+        """
         # Создаем индекс
         dimension = embeddings_np.shape[1]
         num_vectors = len(texts)
         
-        # Подготовка векторов
-        if self.use_cosine:
-            # Нормализация для косинусного сходства
-            faiss.normalize_L2(embeddings_np)
-        
         # Выбор типа индекса в зависимости от параметров и размера данных
-        if self.index_type == 'flat' or num_vectors < 1000:
+        if self.index_type == 'flat' or num_vectors < self.MIN_VECTORS.get(self.index_type, 0):
             # Простой индекс на основе полного перебора
             if self.use_cosine:
                 logger.info(f"Создание Flat IP индекса для {memory_type} (косинусное сходство)")
@@ -71,40 +449,66 @@ class VectorIndex:
                 logger.info(f"Создание Flat L2 индекса для {memory_type} (евклидово расстояние)")
                 index = faiss.IndexFlatL2(dimension)
         
-        elif self.index_type == 'ivf' and num_vectors >= 1000:
+        elif self.index_type == 'ivf':
             # IVF (Inverted File) индекс
             logger.info(f"Создание IVF индекса для {memory_type}")
-            nlist = min(int(np.sqrt(num_vectors) * 4), num_vectors // 10)
-            nlist = max(nlist, 8)  # Минимум 8 кластеров
+            nlist = self._get_nlist(num_vectors)
             
-            if self.use_cosine:
+            metric = faiss.METRIC_INNER_PRODUCT if self.use_cosine else faiss.METRIC_L2
+            
+            # Центроиды, обученные при прошлой сборке, переиспользуем, пока объем
+            # данных не вырос более чем вдвое
+            cached = self._trained_quantizers.get(memory_type)
+            if (cached is not None and cached[0] is not None and cached[0].d == dimension
+                    and cached[0].ntotal <= num_vectors and num_vectors <= 2 * cached[1]):
+                quantizer = faiss.clone_index(cached[0])
+                nlist = quantizer.ntotal
+            elif self.use_cosine:
                 quantizer = faiss.IndexFlatIP(dimension)
-                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
             else:
                 quantizer = faiss.IndexFlatL2(dimension)
-                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
+            
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
             
             # Обучение индекса (требуется для IVF)
             if not index.is_trained:
                 logger.info(f"Обучение IVF индекса для {memory_type}...")
                 index.train(embeddings_np)
+                self._trained_quantizers[memory_type] = (faiss.clone_index(index.quantizer), num_vectors)
             
             # Установка числа проверяемых кластеров
-            index.nprobe = min(nlist // 2, 16)
+            index.nprobe = self._get_nprobe(nlist)
         
-        elif self.index_type == 'hnsw' and num_vectors >= 1000:
+        elif self.index_type == 'ivfpq' and dimension % 8 == 0:
+            # IVF с продуктовым квантованием: 1 байт на подвектор вместо 4 байт на компоненту
+            M = dimension // 8  # Число подквантайзеров (48 для 384-мерных векторов)
+            nlist = self._get_nlist(num_vectors)
+            metric = faiss.METRIC_INNER_PRODUCT if self.use_cosine else faiss.METRIC_L2
+            
+            # OPQ-поворот перед квантованием снижает потери точности PQ
+            logger.info(f"Создание IVFPQ индекса для {memory_type} (OPQ{M},IVF{nlist},PQ{M})")
+            index = faiss.index_factory(dimension, f"OPQ{M},IVF{nlist},PQ{M}", metric)
+            
+            logger.info(f"Обучение IVFPQ индекса для {memory_type}...")
+            index.train(embeddings_np)
+            self._trained_quantizers[memory_type] = (None, num_vectors)
+            
+            # Установка числа проверяемых кластеров
+            faiss.extract_index_ivf(index).nprobe = self._get_nprobe(nlist)
+        
+        elif self.index_type == 'hnsw':
             # HNSW (Hierarchical Navigable Small World)
             logger.info(f"Создание HNSW индекса для {memory_type}")
-            M = 16  # Число исходящих связей в графе (обычно от 8 до 64)
+            M = self.hnsw_m  # Число исходящих связей в графе (обычно от 8 до 64)
             
             if self.use_cosine:
                 index = faiss.IndexHNSWFlat(dimension, M, faiss.METRIC_INNER_PRODUCT)
             else:
                 index = faiss.IndexHNSWFlat(dimension, M, faiss.METRIC_L2)
             
-            # Настройка параметров построения
-            index.hnsw.efConstruction = 40
-            index.hnsw.efSearch = 32
+            # Настройка параметров построения (efConstruction используется при add)
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
         
         else:
             # По умолчанию используем простой индекс
@@ -114,13 +518,145 @@ class VectorIndex:
             else:
                 index = faiss.IndexFlatL2(dimension)
         
+        # Большие индексы переносим на GPU, если он доступен
+        index = self._maybe_to_gpu(memory_type, index, num_vectors)
+        
+        # Идентификаторы векторов совпадают с позициями текстов в хранилище
+        index = faiss.IndexIDMap2(index)
+        
         # Добавляем векторы в индекс
-        index.add(embeddings_np)
+        index.add_with_ids(embeddings_np, np.arange(num_vectors, dtype=np.int64))
         logger.info(f"Индекс для {memory_type} создан, добавлено {num_vectors} векторов")
         
-        # Сохраняем индекс и тексты
+        # Сохраняем индекс, тексты и эмбеддинги
+        self._mark_changed(memory_type)
         self.indexes[memory_type] = index
-        self.texts[memory_type] = texts
+        self.texts[memory_type] = TextStore(texts)
+        self._embeddings.pop(memory_type, None)
+        self._sizes[memory_type] = 0
+        self._append_embeddings(memory_type, embeddings_np)
+    
+    def _get_nlist(self, num_vectors: int) -> int:
+        """
+        Число кластеров IVF: nlist = max(2 * sqrt(N), 20), если не задано явно
+        
+        Args:
+            num_vectors (int): Количество векторов в индексе
+            
+        Returns:
+            int: Число кластеров
+        """
+        if self.nlist is not None:
+            return self.nlist
+        return max(int(2 * np.sqrt(num_vectors)), 20)
+    
+    def _get_nprobe(self, nlist: int) -> int:
+        """
+        Число проверяемых кластеров IVF: nprobe = min(nlist / 4, 10), если не задано явно
+        
+        Args:
+            nlist (int): Число кластеров
+            
+        Returns:
+            int: Число проверяемых кластеров
+        """
+        if self.nprobe is not None:
+            return self.nprobe
+        return max(min(nlist // 4, 10), 1)
+    
+    def tune_nprobe(self, memory_type: str, target_recall: float = 0.95, k: int = 10,
+                    num_queries: int = 100) -> List[Dict[str, float]]:
+        """
+        Подбор nprobe для IVF индекса перебором значений 1, 2, 4, 8, ...
+        
+        В качестве запросов используются векторы самого индекса, эталоном служит
+        точный поиск полным перебором. Выбирается наименьшее nprobe, при котором
+        достигается целевая полнота.
+        
+        Args:
+            memory_type (str): Тип памяти
+            target_recall (float): Целевая полнота Recall@k
+            k (int): Количество соседей для оценки полноты
+            num_queries (int): Количество запросов для замера
+            
+        Returns:
+            List[Dict[str, float]]: Замеры для каждого значения nprobe (nprobe, recall, qps)
+        """
+        if memory_type not in self.indexes:
+            return []
+        
+        index = self.indexes[memory_type]
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            logger.warning(f"Индекс {memory_type} не является IVF, подбор nprobe невозможен")
+            return []
+        
+        # Восстанавливаем векторы базы для эталонного поиска (с учетом OPQ-поворота)
+        ivf.make_direct_map()
+        vectors = index.reconstruct_n(0, index.ntotal)
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+        queries = vectors[sample]
+        k = min(k, len(vectors))
+        
+        exact = faiss.IndexFlatIP(vectors.shape[1]) if self.use_cosine else faiss.IndexFlatL2(vectors.shape[1])
+        exact.add(vectors)
+        _, ground_truth = exact.search(queries, k)
+        
+        measurements = []
+        best_nprobe = None
+        nprobe = 1
+        while nprobe <= ivf.nlist:
+            ivf.nprobe = nprobe
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            elapsed = time.perf_counter() - start
+            
+            recall = np.mean([len(np.intersect1d(f, g)) / k for f, g in zip(found, ground_truth)])
+            measurements.append({
+                "nprobe": nprobe,
+                "recall": float(recall),
+                "qps": len(queries) / elapsed if elapsed > 0 else float('inf')
+            })
+            
+            if recall >= target_recall:
+                best_nprobe = nprobe
+                break
+            nprobe *= 2
+        
+        ivf.nprobe = best_nprobe or min(nprobe, ivf.nlist)
+        self._mark_changed(memory_type)
+        logger.info(f"Для индекса {memory_type} выбрано nprobe={ivf.nprobe}")
+        return measurements
+    
+    def _maybe_to_gpu(self, memory_type: str, index: faiss.Index, num_vectors: int) -> faiss.Index:
+        """
+        Перенос индекса на GPU для больших объемов данных
+        
+        Для небольших индексов накладные расходы на запуск ядер GPU превышают
+        выигрыш, поэтому они остаются на CPU. На GPU переносятся только Flat и IVFFlat.
+        
+        Args:
+            memory_type (str): Тип памяти
+            index (faiss.Index): Индекс на CPU
+            num_vectors (int): Количество векторов в индексе
+            
+        Returns:
+            faiss.Index: Индекс на GPU или исходный индекс
+        """
+        if num_vectors < self.gpu_min_vectors or not isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat)):
+            return index
+        
+        if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+            return index
+        
+        if self._gpu_resources is None:
+            self._gpu_resources = faiss.StandardGpuResources()
+        
+        logger.info(f"Перенос индекса {memory_type} на GPU")
+        return faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
     
     def update_index(self, memory_type: str, new_texts: List[str]) -> None:
         """
@@ -139,21 +675,95 @@ class VectorIndex:
             return
         
         # Создаем эмбеддинги для новых текстов
-        embeddings = self.model.encode(new_texts)
-        embeddings_np = np.array(embeddings).astype('float32')
+        embeddings_np = self._encode(new_texts)
         
-        # Подготовка векторов
-        if self.use_cosine:
-            faiss.normalize_L2(embeddings_np)
+        # Индекс, отображенный в память только для чтения, перед записью читаем целиком
+        if memory_type in self._mmap_paths:
+            self.indexes[memory_type] = faiss.read_index(self._mmap_paths.pop(memory_type))
         
         # Добавляем новые векторы в индекс
-        self.indexes[memory_type].add(embeddings_np)
+        self._mark_changed(memory_type)
+        start = len(self.texts[memory_type])
+        ids = np.arange(start, start + len(new_texts), dtype=np.int64)
+        self.indexes[memory_type].add_with_ids(embeddings_np, ids)
         
-        # Обновляем список текстов
-        if memory_type in self.texts:
-            self.texts[memory_type].extend(new_texts)
-        else:
-            self.texts[memory_type] = new_texts
+        # Обновляем хранилище текстов и эмбеддингов
+        self.texts[memory_type].extend(new_texts)
+        self._append_embeddings(memory_type, embeddings_np)
+    
+    def _append_embeddings(self, memory_type: str, embeddings_np: np.ndarray) -> None:
+        """
+        Добавление эмбеддингов в предвыделенный буфер типа памяти
+        
+        При нехватке места емкость буфера удваивается, поэтому на N добавлений
+        приходится O(log N) перевыделений.
+        
+        Args:
+            memory_type (str): Тип памяти
+            embeddings_np (np.ndarray): Новые эмбеддинги (float32)
+        """
+        buffer = self._embeddings.get(memory_type)
+        size = self._sizes.get(memory_type, 0)
+        needed = size + len(embeddings_np)
+        
+        if buffer is None or needed > len(buffer):
+            capacity = max(needed, 2 * (len(buffer) if buffer is not None else 0), 16)
+            new_buffer = np.empty((capacity, embeddings_np.shape[1]), dtype=np.float32)
+            if buffer is not None:
+                new_buffer[:size] = buffer[:size]
+            buffer = new_buffer
+            self._embeddings[memory_type] = buffer
+        
+        buffer[size:needed] = embeddings_np
+        self._sizes[memory_type] = needed
+    
+    def _reuse_or_encode(self, texts_by_type: Dict[str, List[str]]) -> Dict[str, np.ndarray]:
+        """
+        Получение эмбеддингов для перестройки индексов
+        
+        Эмбеддинги текстов, которые уже есть в индексе, берутся из буфера;
+        модель прогоняется одним вызовом только для новых текстов.
+        
+        Args:
+            texts_by_type (Dict[str, List[str]]): Тексты по типам памяти
+            
+        Returns:
+            Dict[str, np.ndarray]: Эмбеддинги по типам памяти (кроме пустых списков)
+        """
+        rows_by_type = {}
+        missing_texts = []
+        for memory_type, texts in texts_by_type.items():
+            if not texts:
+                continue
+            
+            lookup = {}
+            if self._sizes.get(memory_type) and memory_type in self.texts:
+                lookup = {text: row for row, text in enumerate(self.texts[memory_type])}
+            
+            rows = np.fromiter((lookup.get(text, -1) for text in texts), dtype=np.int64, count=len(texts))
+            rows_by_type[memory_type] = rows
+            missing_texts.extend(texts[i] for i in np.flatnonzero(rows < 0))
+        
+        new_embeddings = self._encode(missing_texts) if missing_texts else None
+        
+        result = {}
+        offset = 0
+        for memory_type, rows in rows_by_type.items():
+            missing = np.flatnonzero(rows < 0)
+            if len(missing) == len(rows):
+                embeddings_np = new_embeddings[offset:offset + len(missing)]
+            else:
+                stored = self._embeddings[memory_type]
+                embeddings_np = np.empty((len(rows), stored.shape[1]), dtype=np.float32)
+                known = rows >= 0
+                embeddings_np[known] = stored[rows[known]]
+                if len(missing):
+                    embeddings_np[missing] = new_embeddings[offset:offset + len(missing)]
+            
+            offset += len(missing)
+            result[memory_type] = embeddings_np
+        
+        return result
     
     def rebuild_index(self, memory_type: str, texts: List[str]) -> None:
         """
@@ -163,10 +773,242 @@ class VectorIndex:
             memory_type (str): Тип памяти
             texts (List[str]): Полный список текстов
         """
-        if memory_type in self.indexes:
-            del self.indexes[memory_type]
+        self.rebuild_indexes({memory_type: texts})
+    
+    def rebuild_indexes(self, texts_by_type: Dict[str, List[str]]) -> None:
+        """
+        Полная перестройка индексов для нескольких типов памяти
+        
+        Args:
+            texts_by_type (Dict[str, List[str]]): Полные списки текстов по типам памяти
+        """
+        to_create = {
+            memory_type: texts
+            for memory_type, texts in texts_by_type.items()
+            if not self._extend_if_appended(memory_type, texts)
+        }
+        if not to_create:
+            return
+        
+        # Эмбеддинги собираем до удаления старых индексов, чтобы переиспользовать буфер
+        embeddings_by_type = self._reuse_or_encode(to_create)
+        
+        for memory_type, texts in to_create.items():
+            self._drop_index(memory_type)
+            if memory_type in embeddings_by_type:
+                self._build_index(memory_type, texts, embeddings_by_type[memory_type])
+            else:
+                logger.warning(f"Не удалось создать индекс для {memory_type}: пустой список текстов")
+    
+    def _extend_if_appended(self, memory_type: str, texts: List[str]) -> bool:
+        """
+        Инкрементальное обновление вместо перестройки для дописанных в конец текстов
+        
+        Если текущие тексты индекса являются началом нового списка, достаточно
+        добавить только новые векторы: перекодирование и переобучение не нужны.
+        
+        Args:
+            memory_type (str): Тип памяти
+            texts (List[str]): Полный список текстов
+            
+        Returns:
+            bool: True если индекс обновлен инкрементально
+        """
+        if memory_type not in self.indexes or memory_type not in self.texts:
+            return False
+        
+        current = self.texts[memory_type]
+        if len(current) == 0 or len(current) > len(texts):
+            return False
+        
+        if any(old != new for old, new in zip(current, texts)):
+            return False
+        
+        if self._needs_rebuild(memory_type, len(texts)):
+            return False
+        
+        self.update_index(memory_type, texts[len(current):])
+        return True
+    
+    def _needs_rebuild(self, memory_type: str, num_vectors: int) -> bool:
+        """
+        Проверка, требует ли рост данных полной перестройки индекса
+        
+        Перестройка нужна, если индекс был построен как Flat из-за малого объема данных,
+        а теперь данных достаточно для настроенного типа, или если IVF индекс вырос
+        более чем вдвое относительно выборки, на которой обучались центроиды.
+        
+        Args:
+            memory_type (str): Тип памяти
+            num_vectors (int): Число векторов после обновления
+            
+        Returns:
+            bool: True если индекс нужно перестроить
+        """
+        index = self.indexes[memory_type]
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        
+        min_vectors = self.MIN_VECTORS.get(self.index_type)
+        if (isinstance(inner, faiss.IndexFlat) and min_vectors is not None
+                and num_vectors >= min_vectors
+                and (self.index_type != 'ivfpq' or inner.d % 8 == 0)):
+            return True
+        
+        cached = self._trained_quantizers.get(memory_type)
+        if faiss.try_extract_index_ivf(index) is not None and cached is not None:
+            return num_vectors > 2 * cached[1]
+        
+        return False
+    
+    def _drop_index(self, memory_type: str) -> None:
+        """
+        Удаление индекса и текстов для указанного типа памяти
+        
+        Args:
+            memory_type (str): Тип памяти
+        """
+        self.indexes.pop(memory_type, None)
+        self.texts.pop(memory_type, None)
+        self._embeddings.pop(memory_type, None)
+        self._sizes.pop(memory_type, None)
+        self._mmap_paths.pop(memory_type, None)
+        self._mark_changed(memory_type)
+    
+    def _mark_changed(self, memory_type: str) -> None:
+        """
+        Отметка индекса как измененного после последнего сохранения
+        
+        Args:
+            memory_type (str): Тип памяти
+        """
+        self._saved_to.pop(memory_type, None)
+        self._meta_saved_to = None
+    
+    def save(self, directory: str) -> None:
+        """
+        Сохранение индексов, текстов и эмбеддингов на диск
+        
+        Каждый файл записывается во временный и затем атомарно подменяется: файлы
+        индексов и эмбеддингов могут быть отображены в память после load, и запись
+        поверх них повредила бы как отображение, так и сам файл. Индексы, не
+        изменившиеся с последнего сохранения или загрузки из той же директории,
+        не перезаписываются.
+        
+        Args:
+            directory (str): Директория для файлов индексов
+        """
+        directory = os.path.abspath(directory)
+        if self._meta_saved_to == directory:
+            return
+        
+        os.makedirs(directory, exist_ok=True)
+        
+        stores = {}
+        for memory_type, index in self.indexes.items():
+            store = self.texts[memory_type]
+            stores[memory_type] = {"blob": bytes(store.blob), "offsets": store.offsets.tobytes()}
+            
+            if self._saved_to.get(memory_type) == directory:
+                continue
+            
+            if self._gpu_resources is not None:
+                index = faiss.index_gpu_to_cpu(index)
+            atomic_write(os.path.join(directory, f"{memory_type}.faiss"),
+                         lambda tmp_path: faiss.write_index(index, tmp_path))
+            
+            embeddings_np = self._embeddings[memory_type][:self._sizes[memory_type]]
+            atomic_write(os.path.join(directory, f"{memory_type}.npy"),
+                         lambda tmp_path: _save_npy(tmp_path, embeddings_np))
+            self._saved_to[memory_type] = directory
+        
+        # Метаданные пишутся последними: load читает только перечисленные в них индексы
+        meta = {
+            "model_name": self.model_name,
+            "use_cosine": self.use_cosine,
+            "texts": stores,
+            "trained_sizes": {memory_type: cached[1] for memory_type, cached in self._trained_quantizers.items()
+                              if memory_type in self.indexes}
+        }
+        atomic_write(os.path.join(directory, "texts.pkl"), lambda tmp_path: _save_pickle(tmp_path, meta))
+        self._meta_saved_to = directory
+        
+        logger.info(f"Индексы сохранены в {directory}")
+    
+    def load(self, directory: str, mmap: bool = True) -> bool:
+        """
+        Загрузка индексов, сохраненных методом save
+        
+        При mmap=True данные индексов и эмбеддингов отображаются в память: страницы
+        подгружаются с диска по мере обращения и могут разделяться между процессами.
+        Индексы применяются только после успешного чтения всех файлов.
+        
+        Args:
+            directory (str): Директория с файлами индексов
+            mmap (bool): Отображать ли индексы в память вместо полного чтения
+            
+        Returns:
+            bool: True если индексы загружены
+        """
+        directory = os.path.abspath(directory)
+        meta_path = os.path.join(directory, "texts.pkl")
+        if not os.path.exists(meta_path):
+            return False
+        
+        with open(meta_path, 'rb') as f:
+            meta = pickle.load(f)
+        
+        # Эмбеддинги другой модели или метрики несовместимы с текущими
+        if meta.get("model_name") != self.model_name or meta.get("use_cosine") != self.use_cosine:
+            logger.warning(f"Индексы в {directory} созданы с другими параметрами, загрузка пропущена")
+            return False
+        
+        loaded = {}
+        for memory_type, stored in meta.get("texts", {}).items():
+            index_path = os.path.join(directory, f"{memory_type}.faiss")
+            if mmap:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            else:
+                index = faiss.read_index(index_path)
+            
+            store = TextStore()
+            store.blob = bytearray(stored["blob"])
+            store.offsets = array('q')
+            store.offsets.frombytes(stored["offsets"])
+            
+            embeddings_np = np.load(os.path.join(directory, f"{memory_type}.npy"),
+                                    mmap_mode='r' if mmap else None)
+            
+            if index.ntotal != len(store) or len(embeddings_np) != len(store):
+                raise ValueError(f"Файлы индекса {memory_type} в {directory} не согласованы")
+            
+            loaded[memory_type] = (index, store, embeddings_np)
+        
+        for memory_type, (index, store, embeddings_np) in loaded.items():
+            self.indexes[memory_type] = index
+            self.texts[memory_type] = store
+            self._embeddings[memory_type] = embeddings_np
+            self._sizes[memory_type] = len(embeddings_np)
+            self._saved_to[memory_type] = directory
+            if mmap:
+                self._mmap_paths[memory_type] = os.path.join(directory, f"{memory_type}.faiss")
+            else:
+                self._mmap_paths.pop(memory_type, None)
+        
+        # Размер обучающей выборки IVF нужен, чтобы решить, когда переобучать центроиды
+        for memory_type, trained_size in meta.get("trained_sizes", {}).items():
+            ivf = faiss.try_extract_index_ivf(self.indexes[memory_type]) if memory_type in loaded else None
+            if ivf is not None:
+                ivf = faiss.downcast_index(ivf)
+            if isinstance(ivf, faiss.IndexIVFFlat):
+                self._trained_quantizers[memory_type] = (faiss.clone_index(ivf.quantizer), trained_size)
+            elif ivf is not None:
+                self._trained_quantizers[memory_type] = (None, trained_size)
+        
+        if set(self.indexes) == set(loaded):
+            self._meta_saved_to = directory
         
-        self.create_index(memory_type, texts)
+        logger.info(f"Индексы загружены из {directory}")
+        return True
     
     def search(self, memory_type: str, query: str, top_k: int = 5, 
               relevance_method: str = 'sigmoid', min_relevance: float = 0.2) -> List[Dict[str, Any]]:
@@ -186,63 +1028,160 @@ class VectorIndex:
         if memory_type not in self.indexes or memory_type not in self.texts:
             return []
         
-        # Создаем эмбеддинг запроса
-        query_embedding = self.model.encode([query])[0].reshape(1, -1).astype('float32')
+        # Эмбеддинг запроса (из кэша, если запрос уже встречался)
+        query_embedding = self._encode_query(query)
+        
+        return self._search_with_embedding(memory_type, query_embedding, top_k,
+                                           relevance_method, min_relevance)
+    
+    def search_multi(self, memory_types: List[str], query: str, top_k: int = 5,
+                     relevance_method: str = 'sigmoid', min_relevance: float = 0.2) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Поиск релевантных текстов сразу по нескольким типам памяти
+        
+        Запрос кодируется один раз, после чего один и тот же эмбеддинг
+        используется для поиска во всех индексах.
+        
+        Args:
+            memory_types (List[str]): Типы памяти
+            query (str): Текст запроса
+            top_k (int): Количество результатов для каждого типа
+            relevance_method (str): Метод расчета релевантности
+            min_relevance (float): Минимальное значение релевантности
+            
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: Результаты поиска по типам памяти
+        """
+        memory_types = [mt for mt in memory_types if mt in self.indexes and mt in self.texts]
+        if not memory_types:
+            return {}
+        
+        query_embedding = self._encode_query(query)
+        
+        return {
+            memory_type: self._search_with_embedding(memory_type, query_embedding, top_k,
+                                                     relevance_method, min_relevance)
+            for memory_type in memory_types
+        }
+    
+    def search_batch(self, memory_type: str, queries: List[str], top_k: int = 5,
+                     relevance_method: str = 'sigmoid', min_relevance: float = 0.2) -> List[List[Dict[str, Any]]]:
+        """
+        Поиск релевантных текстов сразу для нескольких запросов
         
-        # Нормализация для косинусного сходства
-        if self.use_cosine:
-            faiss.normalize_L2(query_embedding)
+        Все запросы кодируются одним вызовом модели и передаются в FAISS одной
+        матрицей, что позволяет распараллелить поиск по запросам.
         
-        # Поиск ближайших соседей
+        Args:
+            memory_type (str): Тип памяти
+            queries (List[str]): Тексты запросов
+            top_k (int): Количество результатов для каждого запроса
+            relevance_method (str): Метод расчета релевантности
+            min_relevance (float): Минимальное значение релевантности
+            
+        Returns:
+            List[List[Dict[str, Any]]]: Списки результатов в порядке запросов
+        """
+        if not queries:
+            return []
+        
+        if memory_type not in self.indexes or memory_type not in self.texts:
+            return [[] for _ in queries]
+        
+        query_embeddings = self._encode(queries)
+        
+        return self._search_with_embeddings(memory_type, query_embeddings, top_k,
+                                            relevance_method, min_relevance)
+    
+    def _search_with_embedding(self, memory_type: str, query_embedding: np.ndarray, top_k: int,
+                               relevance_method: str, min_relevance: float) -> List[Dict[str, Any]]:
+        """
+        Поиск в индексе по готовому эмбеддингу запроса
+        
+        Args:
+            memory_type (str): Тип памяти
+            query_embedding (np.ndarray): Эмбеддинг запроса формы (1, dimension)
+            top_k (int): Количество результатов
+            relevance_method (str): Метод расчета релевантности
+            min_relevance (float): Минимальное значение релевантности
+            
+        Returns:
+            List[Dict[str, Any]]: Список релевантных результатов
+        """
+        return self._search_with_embeddings(memory_type, query_embedding, top_k,
+                                            relevance_method, min_relevance)[0]
+    
+    def _search_with_embeddings(self, memory_type: str, query_embeddings: np.ndarray, top_k: int,
+                                relevance_method: str, min_relevance: float) -> List[List[Dict[str, Any]]]:
+        """
+        Поиск в индексе по матрице эмбеддингов запросов
+        
+        Args:
+            memory_type (str): Тип памяти
+            query_embeddings (np.ndarray): Эмбеддинги запросов формы (n_queries, dimension)
+            top_k (int): Количество результатов для каждого запроса
+            relevance_method (str): Метод расчета релевантности
+            min_relevance (float): Минимальное значение релевантности
+            
+        Returns:
+            List[List[Dict[str, Any]]]: Списки результатов в порядке запросов
+        """
+        # Поиск ближайших соседей для всех запросов одним вызовом
         k = min(top_k, len(self.texts[memory_type]))
-        distances, indices = self.indexes[memory_type].search(query_embedding, k)
-        
-        # Собираем результаты
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.texts[memory_type]):
-                text = self.texts[memory_type][idx]
-                distance = distances[0][i]
-                
-                # Рассчитываем релевантность
-                relevance = self._calculate_relevance(distance, method=relevance_method)
-                
-                # Если релевантность достаточная, добавляем в результаты
-                if relevance >= min_relevance:
-                    results.append({
-                        "text": text,
-                        "index": idx,
-                        "distance": distance,
-                        "relevance": relevance
-                    })
-        
-        return results
-    
-    def _calculate_relevance(self, distance: float, method: str = 'sigmoid') -> float:
-        """
-        Преобразование расстояния в значение релевантности
-        
-        Args:
-            distance (float): Расстояние между векторами
+        distances, indices = self.indexes[memory_type].search(query_embeddings, k)
+        
+        # Релевантность и порог считаем сразу для всей матрицы расстояний
+        n_texts = len(self.texts[memory_type])
+        if njit is not None:
+            method_code = _RELEVANCE_METHODS.get(relevance_method, 0)
+            relevances, masks = _score_kernel(distances, indices, n_texts, method_code, min_relevance)
+        else:
+            relevances = self._calculate_relevance_batch(distances, method=relevance_method)
+            masks = (indices >= 0) & (indices < n_texts) & (relevances >= min_relevance)
+        
+        all_results = []
+        for row_ids, row_distances, row_relevances, mask in zip(indices, distances, relevances, masks):
+            # Собираем результаты только для прошедших фильтр
+            kept_ids = row_ids[mask]
+            texts = self.texts[memory_type].take(kept_ids)
+            
+            results = []
+            for text, idx, distance, relevance in zip(texts, kept_ids, row_distances[mask], row_relevances[mask]):
+                results.append({
+                    "text": text,
+                    "index": int(idx),
+                    "distance": float(distance),
+                    "relevance": float(relevance)
+                })
+            all_results.append(results)
+        
+        return all_results
+    
+    def _calculate_relevance_batch(self, distances: np.ndarray, method: str = 'sigmoid') -> np.ndarray:
+        """
+        Преобразование массива расстояний в значения релевантности
+        
+        Args:
+            distances (np.ndarray): Расстояния между векторами
             method (str): Метод расчета ('inverse', 'exponential', 'sigmoid')
             
         Returns:
-            float: Значение релевантности (от 0 до 1)
+            np.ndarray: Значения релевантности (от 0 до 1)
         """
         if method == 'inverse':
             # Простое преобразование: релевантность = 1 / (1 + расстояние)
-            return 1.0 / (1.0 + distance)
+            return 1.0 / (1.0 + distances)
         
         elif method == 'exponential':
             # Экспоненциальное преобразование: быстрее убывает с расстоянием
-            return np.exp(-distance)
+            return np.exp(-distances)
         
         elif method == 'sigmoid':
             # Сигмоидное преобразование: более гладкий переход
             steepness = 5.0  # Контролирует крутизну перехода
             midpoint = 1.0   # Точка перегиба (при этом расстоянии релевантность = 0.5)
-            return 1.0 / (1.0 + np.exp(steepness * (distance - midpoint)))
+            return 1.0 / (1.0 + np.exp(steepness * (distances - midpoint)))
         
         else:
             # По умолчанию используем простое преобразование
-            return 1.0 / (1.0 + distance)
\ No newline at end of file
+            return 1.0 / (1.0 + distances)
\ No newline at end of file
@@ -5,20 +5,349 @@
 Отслеживает и изменяет различные аспекты отношений на основе взаимодействий.
 """
 
+import os
 import time
 import json
+import bisect
 import re
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick необязателен: без него индикаторы ищутся построчно
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # Numba необязательна: без нее используется NumPy
+    njit = None
 
 logger = logging.getLogger(__name__)
 
+# Порядок аспектов и факторов в векторных расчетах
+_ASPECT_ORDER = ("respect", "trust", "liking", "patience")
+_PERSONALITY_ORDER = (
+    "intellect_appreciation", "humor_appreciation", "formality_preference",
+    "openness", "sensitivity", "forgiveness"
+)
+_ASPECT_INDEX = {name: i for i, name in enumerate(_ASPECT_ORDER)}
+_FACTOR_ORDER = (
+    "positive_tone", "negative_tone", "politeness", "intellectual_stimulation",
+    "user_effort", "personal_address", "repetitive", "flirtation"
+)
+
+# Индексы в векторах аспектов, факторов и личности (в порядке *_ORDER выше)
+_A_RESPECT, _A_TRUST, _A_LIKING, _A_PATIENCE = range(len(_ASPECT_ORDER))
+_F_NEGATIVE, _F_POLITENESS, _F_FLIRTATION = (
+    _FACTOR_ORDER.index("negative_tone"), _FACTOR_ORDER.index("politeness"),
+    _FACTOR_ORDER.index("flirtation")
+)
+_P_INTELLECT, _P_HUMOR, _P_FORMALITY, _P_OPENNESS, _P_SENSITIVITY, _P_FORGIVENESS = range(len(_PERSONALITY_ORDER))
+
+# Названия аспектов и описания факторов для причин изменений (в порядке _ASPECT_ORDER и _FACTOR_ORDER)
+_ASPECT_REASON_NAMES = ("уважения", "доверия", "симпатии", "терпения")
+_FACTOR_DESCRIPTIONS = (
+    "позитивный тон разговора",
+    "негативный тон разговора",
+    "проявленная вежливость",
+    "интеллектуальная стимуляция",
+    "усилия в общении",
+    "личное обращение",
+    "повторяющиеся вопросы",
+    "элементы флирта"
+)
+# Все возможные причины изменений: [увеличение][аспект][фактор]. Одна и та же
+# причина в истории - один и тот же объект строки
+_CHANGE_REASONS = tuple(
+    tuple(
+        tuple(f"{direction} {aspect} из-за фактора: {factor}" for factor in _FACTOR_DESCRIPTIONS)
+        for aspect in _ASPECT_REASON_NAMES
+    )
+    for direction in ("уменьшение", "увеличение")
+)
+
+# Границы уровней аспекта (значение должно строго превышать границу), их названия
+# и готовые описания для известных аспектов (без форматирования при каждом вызове)
+_ASPECT_LEVEL_TH = (-0.7, -0.3, 0.3, 0.7)
+_ASPECT_LEVEL_LABELS = ("очень низкое", "низкое", "нейтральное", "высокое", "очень высокое")
+_ASPECT_DESCRIPTIONS = {
+    name: tuple(f"{label} {name}" for label in _ASPECT_LEVEL_LABELS)
+    for name in _ASPECT_ORDER
+}
+
+# Русские названия аспектов для промпта
+_ASPECT_RU = MappingProxyType({
+    "respect": "Уважение",
+    "trust": "Доверие",
+    "liking": "Симпатия",
+    "patience": "Терпение"
+})
+
+# Факторы личности по умолчанию (копируются в каждый экземпляр Relationship)
+_DEFAULT_PERSONALITY = MappingProxyType({
+    "intellect_appreciation": 0.5,  # ценит интеллект
+    "humor_appreciation": 0.5,      # ценит юмор
+    "formality_preference": 0.5,    # предпочитает формальность
+    "openness": 0.5,                # открытость к новому
+    "sensitivity": 0.5,             # чувствительность к обидам
+    "forgiveness": 0.5              # склонность прощать
+})
+
+
+def _dumps(obj: Any) -> str:
+    """
+    Сериализует объект в JSON (через orjson, если он установлен)
+    
+    Args:
+        obj (Any): Объект для сериализации
+        
+    Returns:
+        str: JSON-строка
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _loads(data: str) -> Any:
+    """
+    Разбирает JSON (через orjson, если он установлен)
+    
+    Args:
+        data (str): JSON-строка
+        
+    Returns:
+        Any: Разобранный объект
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _aspect_changes_kernel(factor_vec, coef, personality, trust_gain, patience_gain, out):
+    """
+    Числовое ядро расчета изменений аспектов для одного взаимодействия
+    (компилируется Numba, если она установлена; результат пишется в out без выделения памяти)
+    
+    Args:
+        factor_vec (np.ndarray): Факторы в порядке _FACTOR_ORDER
+        coef (np.ndarray): Матрица влияния факторов на аспекты
+        personality (np.ndarray): Факторы личности в порядке _PERSONALITY_ORDER
+        trust_gain (float): Рост доверия со временем
+        patience_gain (float): Восстановление терпения со временем
+        out (np.ndarray): Буфер для результата длины len(_ASPECT_ORDER)
+        
+    Returns:
+        np.ndarray: Изменения аспектов в порядке _ASPECT_ORDER (тот же out)
+    """
+    n_aspects, n_factors = coef.shape
+    changes = out
+    for a in range(n_aspects):
+        acc = 0.0
+        for f in range(n_factors):
+            acc += coef[a, f] * factor_vec[f]
+        changes[a] = acc
+    
+    # Время: доверие и терпение
+    changes[_A_TRUST] += trust_gain
+    changes[_A_PATIENCE] += patience_gain
+    # Флирт - в зависимости от открытости
+    changes[_A_LIKING] += factor_vec[_F_FLIRTATION] * (2.0 * personality[_P_OPENNESS] - 1.0) * 0.03
+    # Интеллект, чувствительность к негативу и формальность
+    changes[_A_RESPECT] *= 1.0 + personality[_P_INTELLECT]
+    penalty = factor_vec[_F_NEGATIVE] * 0.02 * personality[_P_SENSITIVITY]
+    for a in range(n_aspects):
+        changes[a] -= penalty
+    changes[_A_RESPECT] += factor_vec[_F_POLITENESS] * 0.03 * personality[_P_FORMALITY]
+    
+    for a in range(n_aspects):
+        if changes[a] > 0.1:
+            changes[a] = 0.1
+        elif changes[a] < -0.1:
+            changes[a] = -0.1
+    return changes
+
+
+if njit is not None:
+    _aspect_changes_kernel = njit(cache=True, fastmath=True)(_aspect_changes_kernel)
+
+
+# Обращение к собеседнику на "вы"/"ты" (условие для учета флирта)
+_YOU_RE = re.compile(r'\bвы\b|\bты\b')
+
+# Индикаторы в тексте взаимодействия
+_POSITIVE_INDICATORS = frozenset([
+    "спасибо", "благодарю", "отлично", "прекрасно", "здорово",
+    "великолепно", "удивительно", "интересно", "умный", "гениальный"
+])
+_NEGATIVE_INDICATORS = frozenset([
+    "глупый", "бесполезный", "плохой", "ужасный", "разочарован",
+    "идиот", "дурак", "злой", "ненавижу", "раздражает"
+])
+_POLITENESS_INDICATORS = frozenset([
+    "пожалуйста", "будьте добры", "извините", "простите", "с уважением"
+])
+_INTELLECTUAL_INDICATORS = frozenset([
+    "почему", "как вы думаете", "что вы считаете", "ваше мнение",
+    "интересный случай", "сложный вопрос", "загадка", "логика"
+])
+_FLIRT_INDICATORS = frozenset([
+    "красивый", "симпатичный", "привлекательный", "умный", "сильный"
+])
+_ALL_INDICATORS = (_POSITIVE_INDICATORS | _NEGATIVE_INDICATORS | _POLITENESS_INDICATORS |
+                   _INTELLECTUAL_INDICATORS | _FLIRT_INDICATORS)
+
+# Текст короче самого короткого индикатора заведомо ничего не содержит
+# (короткие реплики вроде "ок", "ага", "да" не сканируются)
+_MIN_INDICATOR_LEN = min(map(len, _ALL_INDICATORS))
+_NO_INDICATORS = frozenset()
+
+
+# Местоимения обращения (ищутся целыми словами, как _YOU_RE) и отметка
+# об их наличии в результате _find_indicators
+_PRONOUNS = ("вы", "ты")
+_ADDRESS = "<обращение>"
+
+
+def _build_automaton():
+    """
+    Строит автомат Ахо-Корасик по всем индикаторам и местоимениям обращения
+
+    Returns:
+        ahocorasick.Automaton или None, если pyahocorasick не установлен
+    """
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for word in _ALL_INDICATORS:
+        automaton.add_word(word, (word, False))
+    for word in _PRONOUNS:
+        automaton.add_word(word, (word, True))
+    automaton.make_automaton()
+    return automaton
+
+
+_AUTOMATON = _build_automaton()
+
+
+def _is_word_char(char: str) -> bool:
+    """
+    Проверяет, является ли символ частью слова (как \\w в регулярных выражениях)
+
+    Args:
+        char (str): Символ
+
+    Returns:
+        bool: True для букв, цифр и подчеркивания
+    """
+    return char.isalnum() or char == "_"
+
+
+def _find_indicators(text: str) -> frozenset:
+    """
+    Находит индикаторы, встречающиеся в тексте, за один проход
+
+    Индикаторы ищутся как подстроки, чтобы учитывать словоформы
+    ("разочарована", "интересного") и фразы из нескольких слов.
+    Если в том же проходе найдено обращение на "вы"/"ты", в результат
+    добавляется отметка _ADDRESS (см. _has_address).
+
+    Args:
+        text (str): Текст в нижнем регистре
+
+    Returns:
+        frozenset: Найденные индикаторы
+    """
+    if len(text) < _MIN_INDICATOR_LEN:
+        # Отметка обращения без индикаторов ни на что не влияет (см. флирт)
+        return _NO_INDICATORS
+    if _AUTOMATON is None:
+        return frozenset(word for word in _ALL_INDICATORS if word in text)
+
+    found = set()
+    for end, (word, is_pronoun) in _AUTOMATON.iter(text):
+        if not is_pronoun:
+            found.add(word)
+            continue
+        # Местоимение считается только отдельным словом
+        start = end - len(word) + 1
+        if ((start == 0 or not _is_word_char(text[start - 1])) and
+                (end + 1 == len(text) or not _is_word_char(text[end + 1]))):
+            found.add(_ADDRESS)
+    return frozenset(found)
+
+
+def _has_address(text: str, found: frozenset) -> bool:
+    """
+    Проверяет, обращается ли текст к собеседнику на "вы"/"ты"
+
+    Args:
+        text (str): Текст в нижнем регистре
+        found (frozenset): Результат _find_indicators для этого текста
+
+    Returns:
+        bool: True, если обращение есть
+    """
+    if _AUTOMATON is not None:
+        return _ADDRESS in found
+    return _YOU_RE.search(text) is not None
+
+
+class InteractionFactors:
+    """
+    Факторы одного взаимодействия, влияющие на отношения (от 0.0 до 1.0)
+    """
+    
+    __slots__ = _FACTOR_ORDER
+    
+    def __init__(self):
+        """
+        Инициализация нулевых факторов
+        """
+        self.positive_tone = 0.0             # позитивный тон разговора
+        self.negative_tone = 0.0             # негативный тон разговора
+        self.politeness = 0.0                # проявленная вежливость
+        self.intellectual_stimulation = 0.0  # интеллектуальная стимуляция
+        self.user_effort = 0.0               # усилия в общении
+        self.personal_address = 0.0          # личное обращение
+        self.repetitive = 0.0                # повторяющиеся вопросы
+        self.flirtation = 0.0                # элементы флирта
+    
+    def as_array(self) -> np.ndarray:
+        """
+        Упаковывает факторы в вектор
+        
+        Returns:
+            np.ndarray: Факторы в порядке _FACTOR_ORDER
+        """
+        return np.array((
+            self.positive_tone, self.negative_tone, self.politeness, self.intellectual_stimulation,
+            self.user_effort, self.personal_address, self.repetitive, self.flirtation
+        ))
+
+
 class RelationshipAspect:
     """
     Представляет один аспект отношений (уважение, доверие, симпатия, терпение)
     """
     
+    # Границы уровней аспекта (значение должно строго превышать границу) и их названия
+    _LEVEL_TH = _ASPECT_LEVEL_TH
+    _LEVEL_LABELS = _ASPECT_LEVEL_LABELS
+    
+    __slots__ = ("name", "value", "weight")
+    
     def __init__(self, name: str, initial_value: float = 0.0, weight: float = 0.25):
         """
         Инициализация аспекта отношений
@@ -43,8 +372,13 @@ class RelationshipAspect:
             float: Новое значение
         """
         old_value = self.value
-        self.value = max(-1.0, min(1.0, self.value + change))
-        return self.value - old_value
+        value = old_value + change
+        if value > 1.0:
+            value = 1.0
+        elif value < -1.0:
+            value = -1.0
+        self.value = value
+        return value - old_value
     
     def get_description(self) -> str:
         """
@@ -53,16 +387,25 @@ class RelationshipAspect:
         Returns:
             str: Описание аспекта
         """
-        if self.value > 0.7:
-            return f"очень высокое {self.name}"
-        elif self.value > 0.3:
-            return f"высокое {self.name}"
-        elif self.value > -0.3:
-            return f"нейтральное {self.name}"
-        elif self.value > -0.7:
-            return f"низкое {self.name}"
-        else:
-            return f"очень низкое {self.name}"
+        return self.describe(self.name, self.value)
+    
+    @classmethod
+    def describe(cls, name: str, value: float) -> str:
+        """
+        Получение текстового описания аспекта по его значению
+        
+        Args:
+            name (str): Название аспекта
+            value (float): Значение аспекта
+            
+        Returns:
+            str: Описание аспекта
+        """
+        level = bisect.bisect_left(cls._LEVEL_TH, value)
+        descriptions = _ASPECT_DESCRIPTIONS.get(name)
+        if descriptions is not None:
+            return descriptions[level]
+        return f"{cls._LEVEL_LABELS[level]} {name}"
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -95,14 +438,146 @@ class RelationshipAspect:
         )
 
 
+class RelationshipHistory:
+    """
+    Кольцевой буфер истории изменений отношений фиксированной емкости.
+    Записи хранятся по столбцам в массивах NumPy; словарь записи создается
+    только при обращении к ней
+    """
+    
+    __slots__ = ("maxlen", "_timestamps", "_rapport", "_magnitudes", "_aspects", "_reasons", "_head", "_count")
+    
+    def __init__(self, maxlen: int):
+        """
+        Инициализация пустой истории
+        
+        Args:
+            maxlen (int): Максимальное количество хранимых записей
+        """
+        self.maxlen = maxlen
+        self._timestamps = np.empty(maxlen)
+        self._rapport = np.empty(maxlen)
+        self._magnitudes = np.empty(maxlen)
+        self._aspects = np.empty((maxlen, len(_ASPECT_ORDER)))
+        self._reasons: List[Optional[str]] = [None] * maxlen
+        self._head = 0   # позиция следующей записи
+        self._count = 0  # количество хранимых записей
+    
+    def append(self, timestamp: float, reason: str, rapport: float, aspects: Tuple[float, ...],
+               change_magnitude: float) -> None:
+        """
+        Добавляет запись, вытесняя самую старую при заполнении буфера
+        
+        Args:
+            timestamp (float): Время изменения
+            reason (str): Причина изменения
+            rapport (float): Значение общего отношения
+            aspects (tuple): Значения аспектов в порядке _ASPECT_ORDER
+            change_magnitude (float): Величина изменения
+        """
+        head = self._head
+        self._timestamps[head] = timestamp
+        self._rapport[head] = rapport
+        self._magnitudes[head] = change_magnitude
+        self._aspects[head] = aspects
+        self._reasons[head] = reason
+        self._head = (head + 1) % self.maxlen
+        if self._count < self.maxlen:
+            self._count += 1
+    
+    def extend(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """
+        Добавляет записи в виде словарей (см. __getitem__)
+        
+        Args:
+            entries (Iterable[Dict[str, Any]]): Записи истории
+        """
+        for entry in entries:
+            self.append(entry.get("timestamp", 0.0), entry.get("reason", ""), entry.get("rapport", 0.0),
+                        entry.get("aspects", (0.0,) * len(_ASPECT_ORDER)), entry.get("change_magnitude", 0.0))
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """
+        Возвращает запись по логическому индексу (0 - самая старая, -1 - последняя)
+        
+        Args:
+            index (int): Индекс записи
+            
+        Returns:
+            Dict[str, Any]: Запись истории
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("индекс истории вне диапазона")
+        pos = (self._head - self._count + index) % self.maxlen
+        return {
+            "timestamp": float(self._timestamps[pos]),
+            "reason": self._reasons[pos],
+            "rapport": float(self._rapport[pos]),
+            "aspects": tuple(self._aspects[pos].tolist()),
+            "change_magnitude": float(self._magnitudes[pos])
+        }
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self._count):
+            yield self[index]
+
+
 class Relationship:
     """
     Класс для отслеживания отношений персонажа к пользователю
     """
     
+    __slots__ = (
+        "character_name", "rapport", "personality_factors", "history", "history_path",
+        "created_at", "last_updated", "_name_re", "_aspect_values", "_personality",
+        "_version", "_cached_status", "_cached_status_ver",
+        "_cached_summary", "_cached_summary_ver", "_changes_buf"
+    )
+    
+    # Максимальное количество записей в истории изменений
+    HISTORY_LIMIT = 50
+    
+    # Количество последних записей в памяти, если история ведется в файле
+    HISTORY_TAIL = 5
+    
+    # Размер файла истории, после которого он ротируется (старые записи переносятся
+    # в "<путь>.1", "<путь>.2", ... - следующий свободный номер, старые файлы не удаляются)
+    HISTORY_FILE_MAX_BYTES = 1024 * 1024
+    
+    # Размер блока при чтении хвоста файла истории с конца
+    HISTORY_READ_BLOCK = 4096
+    
+    # Границы уровней общего отношения (значение должно строго превышать границу) и их названия
+    _RAPPORT_TH = (-0.8, -0.6, -0.3, -0.1, 0.1, 0.3, 0.6, 0.8)
+    _RAPPORT_LABELS = ("враждебные", "очень плохие", "плохие", "напряженные", "нейтральные",
+                       "положительные", "хорошие", "очень хорошие", "превосходные")
+    
+    # Веса аспектов (_ASPECT_ORDER) в общей оценке отношений:
+    # уважение, доверие, симпатия, терпение. Сумма весов равна 1,
+    # поэтому взвешенное среднее - просто скалярное произведение
+    _ASPECT_WEIGHTS = np.array([0.3, 0.3, 0.25, 0.15])
+    assert abs(_ASPECT_WEIGHTS.sum() - 1.0) < 1e-9
+    
+    # Линейное влияние факторов (_FACTOR_ORDER) на аспекты (_ASPECT_ORDER):
+    # уважение - интеллектуальная стимуляция и усилия пользователя,
+    # доверие - тональность, симпатия - вежливость, тональность и личные обращения,
+    # терпение истощается от повторяющихся вопросов
+    _COEF = np.array([
+        [0.0, 0.0, 0.0, 0.05, 0.03, 0.0, 0.0, 0.0],
+        [0.03, -0.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+        [0.05, -0.06, 0.04, 0.0, 0.0, 0.02, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, -0.1, 0.0],
+    ])
+    
     def __init__(self, character_name: str, initial_rapport: float = 0.0, 
                  initial_aspects: Optional[Dict[str, float]] = None, 
-                 personality_factors: Optional[Dict[str, float]] = None):
+                 personality_factors: Optional[Dict[str, float]] = None,
+                 history_path: Optional[str] = None):
         """
         Инициализация отношений
         
@@ -111,89 +586,219 @@ class Relationship:
             initial_rapport (float): Начальный уровень общего отношения (-1.0 до 1.0)
             initial_aspects (dict): Начальные значения различных аспектов отношений
             personality_factors (dict): Факторы личности, влияющие на изменение отношений
+            history_path (str, optional): Путь к JSONL-файлу истории изменений. Если указан,
+                история дописывается в файл, а в памяти хранятся только последние записи;
+                непустой существующий файл переносится в архив (см. _archive_history_file)
         """
         self.character_name = character_name
         
-        # Общий уровень отношений (от -1.0 до 1.0)
+        # Шаблон для поиска личных обращений к персонажу
+        self._name_re = re.compile(rf'\b{re.escape(character_name)}\b', re.IGNORECASE)
+        
+        # Общий уровень отношений (от -1.0 до 1.0). Изменяется только методами класса:
+        # прямое присваивание не увеличивает _version, и кэшированные описания устаревают
         self.rapport = initial_rapport
         
-        # Инициализация аспектов отношений с весами
-        aspect_weights = {
-            "respect": 0.3,    # уважение
-            "trust": 0.3,      # доверие
-            "liking": 0.25,    # симпатия
-            "patience": 0.15   # терпение
-        }
+        # Значения аспектов отношений хранятся массивом в порядке _ASPECT_ORDER
+        init_values = initial_aspects or {}
+        self._aspect_values = np.clip(
+            np.array([init_values.get(name, 0.0) for name in _ASPECT_ORDER], dtype=np.float64),
+            -1.0, 1.0
+        )
         
-        init_values = initial_aspects or {
-            "respect": 0.0,
-            "trust": 0.0,
-            "liking": 0.0,
-            "patience": 0.0
-        }
+        # Факторы личности персонажа, влияющие на изменение отношений
+        self.personality_factors = personality_factors or dict(_DEFAULT_PERSONALITY)
+        # Те же факторы в порядке _PERSONALITY_ORDER для расчетов
+        self._personality = np.array(
+            [self.personality_factors.get(name, 0.5) for name in _PERSONALITY_ORDER],
+            dtype=np.float64
+        )
         
-        self.aspects = {}
-        for name, weight in aspect_weights.items():
-            value = init_values.get(name, 0.0)
-            self.aspects[name] = RelationshipAspect(name, value, weight)
+        # Буфер для ядра расчета изменений (переиспользуется между взаимодействиями)
+        self._changes_buf = np.empty(len(_ASPECT_ORDER))
         
-        # Факторы личности персонажа, влияющие на изменение отношений
-        self.personality_factors = personality_factors or {
-            "intellect_appreciation": 0.5,  # ценит интеллект
-            "humor_appreciation": 0.5,      # ценит юмор
-            "formality_preference": 0.5,    # предпочитает формальность
-            "openness": 0.5,                # открытость к новому
-            "sensitivity": 0.5,             # чувствительность к обидам
-            "forgiveness": 0.5              # склонность прощать
-        }
+        # История изменений отношений (хранятся только последние записи)
+        self.history_path = history_path
+        self.history = RelationshipHistory(self.HISTORY_TAIL if history_path else self.HISTORY_LIMIT)
+        if history_path:
+            self._start_history_file()
         
-        # История изменений отношений
-        self.history = []
+        # Версия состояния: увеличивается при каждом изменении отношений
+        # и служит ключом для кэша описаний статуса
+        self._version = 0
+        self._cached_status = None
+        self._cached_status_ver = -1
+        self._cached_summary = None
+        self._cached_summary_ver = -1
         
-        # Временные метки
-        self.created_at = time.time()
-        self.last_updated = time.time()
+        # Временные метки (одна на создание и начальную запись истории)
+        now = time.time()
+        self.created_at = now
+        self.last_updated = now
         
         # Сохраняем начальное состояние в историю
-        self._add_to_history("Начальное состояние", self.rapport, self._get_aspect_values(), 0.0)
+        self._add_to_history("Начальное состояние", self.rapport, self._get_aspect_snapshot(), 0.0, now)
     
-    def _get_aspect_values(self) -> Dict[str, float]:
+    @property
+    def aspects(self) -> Dict[str, float]:
         """
-        Получение текущих значений всех аспектов
+        Текущие значения всех аспектов
         
         Returns:
             Dict[str, float]: Словарь с значениями аспектов
         """
-        return {name: aspect.value for name, aspect in self.aspects.items()}
+        return dict(zip(_ASPECT_ORDER, self._aspect_values.tolist()))
     
-    def _add_to_history(self, reason: str, rapport: float, aspects: Dict[str, float], 
-                       change_magnitude: float) -> None:
+    def _get_aspect_snapshot(self) -> Tuple[float, ...]:
+        """
+        Получение значений аспектов в порядке _ASPECT_ORDER для записи в историю
+        
+        Returns:
+            Tuple[float, ...]: Значения аспектов
+        """
+        return tuple(self._aspect_values.tolist())
+    
+    def _add_to_history(self, reason: str, rapport: float, aspects: Tuple[float, ...], 
+                       change_magnitude: float, timestamp: Optional[float] = None) -> None:
         """
         Добавляет изменение отношений в историю
         
         Args:
             reason (str): Причина изменения
             rapport (float): Новое значение общего отношения
-            aspects (dict): Новые значения аспектов
+            aspects (tuple): Новые значения аспектов в порядке _ASPECT_ORDER
             change_magnitude (float): Величина изменения (для определения важности)
+            timestamp (float, optional): Время изменения (по умолчанию - текущее)
         """
-        timestamp = time.time()
-        
-        entry = {
-            "timestamp": timestamp,
-            "datetime": datetime.fromtimestamp(timestamp).isoformat(),
-            "reason": reason,
-            "rapport": rapport,
-            "aspects": aspects.copy(),
-            "change_magnitude": change_magnitude
-        }
+        if timestamp is None:
+            timestamp = time.time()
         
-        self.history.append(entry)
+        self.history.append(timestamp, reason, rapport, aspects, change_magnitude)
+        if self.history_path:
+            self._write_history([self.history[-1]])
         self.last_updated = timestamp
+        self._version += 1
+    
+    @staticmethod
+    def _export_history_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Преобразует запись истории в сериализуемый вид (снимок аспектов - в словарь)
         
-        # Ограничиваем размер истории
-        if len(self.history) > 50:
-            self.history = self.history[-50:]
+        Args:
+            entry (Dict[str, Any]): Запись истории
+            
+        Returns:
+            Dict[str, Any]: Запись для сохранения
+        """
+        return {**entry, "aspects": dict(zip(_ASPECT_ORDER, entry["aspects"]))}
+    
+    @staticmethod
+    def _import_history_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Преобразует сохраненную запись истории во внутренний вид (словарь аспектов - в снимок)
+        
+        Args:
+            entry (Dict[str, Any]): Сохраненная запись истории
+            
+        Returns:
+            Dict[str, Any]: Запись истории
+        """
+        aspects = entry.get("aspects", {})
+        if isinstance(aspects, dict):
+            entry = {**entry, "aspects": tuple(aspects.get(name, 0.0) for name in _ASPECT_ORDER)}
+        return entry
+    
+    def _start_history_file(self) -> None:
+        """
+        Готовит файл истории для новых отношений. Непустой файл прежних отношений
+        (например, если relationship.json не удалось прочитать) не перезаписывается,
+        а переносится в архив
+        """
+        try:
+            directory = os.path.dirname(self.history_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.history_path) and os.path.getsize(self.history_path) > 0:
+                self._archive_history_file()
+        except OSError as e:
+            logger.error(f"Ошибка при подготовке файла истории отношений {self.history_path}: {e}")
+    
+    def _write_history(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Дописывает записи в JSONL-файл истории. Файл, превысивший HISTORY_FILE_MAX_BYTES,
+        ротируется, чтобы он не рос без ограничений
+        
+        Args:
+            entries (List[Dict[str, Any]]): Записи истории
+        """
+        try:
+            with open(self.history_path, 'a', encoding='utf-8') as f:
+                f.writelines(
+                    _dumps(self._export_history_entry(entry)) + "\n"
+                    for entry in entries
+                )
+                size = f.tell()
+            if size > self.HISTORY_FILE_MAX_BYTES:
+                self._rotate_history_file()
+        except OSError as e:
+            logger.error(f"Ошибка при записи истории отношений в {self.history_path}: {e}")
+    
+    def _archive_history_file(self) -> str:
+        """
+        Переносит файл истории в "<путь>.N" со следующим свободным номером N,
+        так что ранее перенесенные файлы не перезаписываются
+        
+        Returns:
+            str: Путь к перенесенному файлу
+        """
+        number = 1
+        while os.path.exists(f"{self.history_path}.{number}"):
+            number += 1
+        archived_path = f"{self.history_path}.{number}"
+        os.rename(self.history_path, archived_path)
+        logger.info(f"Файл истории отношений перенесен в {archived_path}")
+        return archived_path
+    
+    def _rotate_history_file(self) -> None:
+        """
+        Переносит файл истории в архив и начинает новый файл с последних записей,
+        хранящихся в памяти
+        """
+        self._archive_history_file()
+        with open(self.history_path, 'w', encoding='utf-8') as f:
+            f.writelines(
+                _dumps(self._export_history_entry(entry)) + "\n"
+                for entry in self.history
+            )
+    
+    def _read_history_tail(self) -> List[Dict[str, Any]]:
+        """
+        Читает последние записи из JSONL-файла истории. Файл читается блоками с конца,
+        поэтому время загрузки не зависит от длины истории
+        
+        Returns:
+            List[Dict[str, Any]]: Последние записи истории
+        """
+        maxlen = self.history.maxlen
+        try:
+            with open(self.history_path, 'rb') as f:
+                position = f.seek(0, os.SEEK_END)
+                data = b""
+                # Нужно на один перевод строки больше: первая строка блока может быть неполной
+                while position > 0 and data.count(b"\n") <= maxlen:
+                    step = min(self.HISTORY_READ_BLOCK, position)
+                    position -= step
+                    f.seek(position)
+                    data = f.read(step) + data
+            
+            lines = data.split(b"\n")
+            if position > 0:
+                lines = lines[1:]
+            lines = [line for line in lines if line.strip()][-maxlen:]
+            return [self._import_history_entry(_loads(line.decode('utf-8'))) for line in lines]
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка при чтении истории отношений из {self.history_path}: {e}")
+            return []
     
     def update_from_interaction(self, user_message: str, character_response: str) -> Dict[str, Any]:
         """
@@ -211,56 +816,112 @@ class Relationship:
         response_text = character_response.lower()
         
         # Анализ текста для выявления факторов, влияющих на отношения
-        factors = self._analyze_interaction(user_text, response_text)
+        factor_vec = self._analyze_interaction(user_text, response_text).as_array()
+        
+        # Одна метка времени на все взаимодействие: рост доверия, восстановление
+        # терпения и запись в историю согласованы между собой
+        now = time.time()
         
         # Рассчитываем изменения в аспектах отношений
-        aspect_changes = self._calculate_aspect_changes(factors)
+        if njit is not None:
+            changes = _aspect_changes_kernel(
+                factor_vec, self._COEF, self._personality, *self._time_gains(now), self._changes_buf
+            )
+        else:
+            changes = self._add_time_changes(self._calculate_aspect_changes(factor_vec), now)
+        
+        return self._apply_aspect_changes(factor_vec, changes, now)
+    
+    def batch_update_from_interactions(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Обновляет отношения по последовательности взаимодействий (например, при загрузке
+        журнала переписки). Результат тот же, что у последовательных вызовов
+        update_from_interaction, но зависящая только от текста часть изменений
+        рассчитывается одной матричной операцией для всех взаимодействий
         
+        Args:
+            pairs (List[Tuple[str, str]]): Пары (сообщение пользователя, ответ персонажа)
+            
+        Returns:
+            List[Dict[str, Any]]: Информация об изменении отношений для каждого взаимодействия
+        """
+        if not pairs:
+            return []
+        
+        factor_matrix = np.stack([
+            self._analyze_interaction(user_message.lower(), character_response.lower()).as_array()
+            for user_message, character_response in pairs
+        ])
+        changes_matrix = self._calculate_aspect_changes(factor_matrix)
+        now = time.time()
+        
+        # Изменения, зависящие от времени, и ограничение применяются по шагам:
+        # они зависят от состояния после предыдущего взаимодействия
+        return [
+            self._apply_aspect_changes(factor_vec, self._add_time_changes(changes, now), now)
+            for factor_vec, changes in zip(factor_matrix, changes_matrix)
+        ]
+    
+    def _apply_aspect_changes(self, factor_vec: np.ndarray, changes: np.ndarray,
+                              now: float) -> Dict[str, Any]:
+        """
+        Применяет рассчитанные изменения аспектов и записывает их в историю
+        
+        Args:
+            factor_vec (np.ndarray): Факторы взаимодействия в порядке _FACTOR_ORDER
+            changes (np.ndarray): Изменения аспектов в порядке _ASPECT_ORDER
+            now (float): Время взаимодействия
+            
+        Returns:
+            dict: Информация об изменении отношений
+        """
         # Сохраняем старые значения для расчета изменений
         old_rapport = self.rapport
-        old_aspects = self._get_aspect_values()
+        old_values = self._aspect_values
         
         # Обновляем аспекты
-        for aspect_name, change in aspect_changes.items():
-            if aspect_name in self.aspects:
-                self.aspects[aspect_name].update(change)
+        self._aspect_values = np.clip(old_values + changes, -1.0, 1.0)
         
         # Рассчитываем новый общий уровень отношений как взвешенное среднее аспектов
-        weighted_sum = sum(aspect.value * aspect.weight for aspect in self.aspects.values())
-        total_weight = sum(aspect.weight for aspect in self.aspects.values())
-        
-        self.rapport = max(-1.0, min(1.0, weighted_sum / total_weight))
+        self.rapport = self._weighted_rapport()
+        self._version += 1
         
         # Вычисляем общую величину изменения
-        aspect_change_magnitude = sum(abs(change) for change in aspect_changes.values())
+        aspect_change_magnitude = float(np.abs(changes).sum())
         rapport_change = abs(self.rapport - old_rapport)
         change_magnitude = (aspect_change_magnitude + rapport_change) / 2
         
         # Определяем основную причину изменения
-        reason = self._determine_change_reason(factors, aspect_changes)
+        reason = self._determine_change_reason(factor_vec, changes)
         
         # Добавляем в историю, если произошло значимое изменение
         if change_magnitude > 0.01:
-            self._add_to_history(reason, self.rapport, self._get_aspect_values(), change_magnitude)
+            self._add_to_history(reason, self.rapport, self._get_aspect_snapshot(), change_magnitude, now)
         
         # Формируем результат для возврата
-        new_aspects = self._get_aspect_values()
         
         result = {
             "old_rapport": old_rapport,
             "new_rapport": self.rapport,
             "rapport_change": self.rapport - old_rapport,
-            "aspect_changes": {
-                aspect: new_aspects[aspect] - old_aspects[aspect]
-                for aspect in new_aspects
-            },
+            "aspect_changes": dict(zip(_ASPECT_ORDER, (self._aspect_values - old_values).tolist())),
             "reason": reason,
             "magnitude": change_magnitude
         }
         
         return result
     
-    def _analyze_interaction(self, user_text: str, response_text: str) -> Dict[str, float]:
+    def _weighted_rapport(self) -> float:
+        """
+        Рассчитывает общий уровень отношений как взвешенное среднее аспектов
+        
+        Returns:
+            float: Общий уровень отношений (от -1.0 до 1.0)
+        """
+        weighted = float(self._aspect_values @ self._ASPECT_WEIGHTS)
+        return max(-1.0, min(1.0, weighted))
+    
+    def _analyze_interaction(self, user_text: str, response_text: str) -> InteractionFactors:
         """
         Анализирует взаимодействие для выявления факторов, влияющих на отношения
         
@@ -269,232 +930,186 @@ class Relationship:
             response_text (str): Ответ персонажа (в нижнем регистре)
             
         Returns:
-            Dict[str, float]: Факторы, влияющие на отношения
+            InteractionFactors: Факторы, влияющие на отношения
         """
-        factors = {}
-        
-        # Анализ тональности
-        factors["positive_tone"] = 0.0
-        factors["negative_tone"] = 0.0
-        
-        # Позитивные индикаторы
-        positive_indicators = [
-            "спасибо", "благодарю", "отлично", "прекрасно", "здорово", 
-            "великолепно", "удивительно", "интересно", "умный", "гениальный"
-        ]
-        
-        # Негативные индикаторы
-        negative_indicators = [
-            "глупый", "бесполезный", "плохой", "ужасный", "разочарован", 
-            "идиот", "дурак", "злой", "ненавижу", "раздражает"
-        ]
-        
+        factors = InteractionFactors()
+
+        user_found = _find_indicators(user_text)
+        response_found = _find_indicators(response_text)
+
         # Считаем количество позитивных и негативных индикаторов в обеих частях беседы
-        for indicator in positive_indicators:
-            if indicator in user_text:
-                factors["positive_tone"] += 0.1
-            if indicator in response_text:
-                factors["positive_tone"] += 0.05
-                
-        for indicator in negative_indicators:
-            if indicator in user_text:
-                factors["negative_tone"] += 0.1
-            if indicator in response_text:
-                factors["negative_tone"] += 0.15  # Негативный ответ персонажа влияет сильнее
-        
-        # Проверяем наличие вежливости
-        factors["politeness"] = 0.0
-        politeness_indicators = ["пожалуйста", "будьте добры", "извините", "простите", "с уважением"]
-        for indicator in politeness_indicators:
-            if indicator in user_text:
-                factors["politeness"] += 0.1
-        
-        # Проверяем наличие интересных вопросов
-        factors["intellectual_stimulation"] = 0.0
-        intellectual_indicators = [
-            "почему", "как вы думаете", "что вы считаете", "ваше мнение",
-            "интересный случай", "сложный вопрос", "загадка", "логика"
-        ]
-        for indicator in intellectual_indicators:
-            if indicator in user_text:
-                factors["intellectual_stimulation"] += 0.1
-        
+        # (негативный ответ персонажа влияет сильнее)
+        factors.positive_tone = min(1.0, 0.1 * len(user_found & _POSITIVE_INDICATORS) +
+                                    0.05 * len(response_found & _POSITIVE_INDICATORS))
+        factors.negative_tone = min(1.0, 0.1 * len(user_found & _NEGATIVE_INDICATORS) +
+                                    0.15 * len(response_found & _NEGATIVE_INDICATORS))
+
+        # Вежливость и интересные вопросы
+        factors.politeness = min(1.0, 0.1 * len(user_found & _POLITENESS_INDICATORS))
+        factors.intellectual_stimulation = min(1.0, 0.1 * len(user_found & _INTELLECTUAL_INDICATORS))
+
+        # Флирт (это может быть воспринято по-разному в зависимости от персонажа)
+        # учитывается только при обращении к собеседнику
+        flirt_found = user_found & _FLIRT_INDICATORS
+        if flirt_found and _has_address(user_text, user_found):
+            factors.flirtation = min(1.0, 0.1 * len(flirt_found))
+
         # Длина и сложность сообщений
-        factors["user_effort"] = min(0.3, len(user_text) / 500)  # Длинные сообщения показывают усилия
-        
+        factors.user_effort = min(0.3, len(user_text) / 500)  # Длинные сообщения показывают усилия
+
         # Персональные обращения
-        factors["personal_address"] = 0.0
-        if re.search(fr'\b{self.character_name}\b', user_text, re.IGNORECASE):
-            factors["personal_address"] += 0.1
-        
-        # Проверка на повторяющиеся вопросы (раздражающий фактор)
-        factors["repetitive"] = 0.0
-        
-        # Флирт (это может быть воспринято по-разному в зависимости от персонажа)
-        factors["flirtation"] = 0.0
-        flirt_indicators = ["красивый", "симпатичный", "привлекательный", "умный", "сильный"]
-        for indicator in flirt_indicators:
-            if indicator in user_text and re.search(r'\bвы\b|\bты\b', user_text):
-                factors["flirtation"] += 0.1
-        
-        # Нормализуем факторы
-        for key in factors:
-            factors[key] = min(1.0, factors[key])
+        if self._name_re.search(user_text):
+            factors.personal_address = 0.1
+
+        # Проверка на повторяющиеся вопросы (раздражающий фактор) пока не реализована
         
         return factors
     
-    def _calculate_aspect_changes(self, factors: Dict[str, float]) -> Dict[str, float]:
+    def _calculate_aspect_changes(self, factors: np.ndarray) -> np.ndarray:
         """
         Рассчитывает изменения в аспектах отношений на основе выявленных факторов
+        (без учета времени, см. _add_time_changes)
         
         Args:
-            factors (Dict[str, float]): Факторы, влияющие на отношения
+            factors (np.ndarray): Факторы в порядке _FACTOR_ORDER - вектор для одного
+                взаимодействия или матрица (взаимодействие x фактор)
             
         Returns:
-            Dict[str, float]: Изменения в различных аспектах отношений
+            np.ndarray: Изменения аспектов в порядке _ASPECT_ORDER (вектор или матрица)
         """
-        changes = {
-            "respect": 0.0,
-            "trust": 0.0,
-            "liking": 0.0,
-            "patience": 0.0
-        }
+        negative_tone = factors[..., _F_NEGATIVE]
+        politeness = factors[..., _F_POLITENESS]
+        flirtation = factors[..., _F_FLIRTATION]
+        intellect, _, formality, openness, sensitivity, _ = self._personality.tolist()
         
-        # Уважение увеличивается от интеллектуальной стимуляции и усилий пользователя
-        changes["respect"] += factors.get("intellectual_stimulation", 0.0) * 0.05
-        changes["respect"] += factors.get("user_effort", 0.0) * 0.03
-        
-        # Доверие медленно растет со временем и увеличивается от позитивной тональности
-        time_factor = min(0.01, (time.time() - self.created_at) / (86400 * 30))  # Максимум 0.01 в месяц
-        changes["trust"] += time_factor
-        changes["trust"] += factors.get("positive_tone", 0.0) * 0.03
-        changes["trust"] -= factors.get("negative_tone", 0.0) * 0.05
-        
-        # Симпатия зависит от вежливости, позитивной тональности и персональных обращений
-        changes["liking"] += factors.get("politeness", 0.0) * 0.04
-        changes["liking"] += factors.get("positive_tone", 0.0) * 0.05
-        changes["liking"] -= factors.get("negative_tone", 0.0) * 0.06
-        changes["liking"] += factors.get("personal_address", 0.0) * 0.02
+        changes = factors @ self._COEF.T
         
         # Флирт влияет на симпатию в зависимости от персонажа
-        flirt_impact = factors.get("flirtation", 0.0) * (2.0 * self.personality_factors.get("openness", 0.5) - 1.0)
         # Для закрытых персонажей флирт может иметь негативное влияние
-        changes["liking"] += flirt_impact * 0.03
-        
-        # Терпение истощается от повторяющихся вопросов и восстанавливается со временем
-        changes["patience"] -= factors.get("repetitive", 0.0) * 0.1
-        time_since_update = time.time() - self.last_updated
-        patience_recovery = min(0.05, time_since_update / 3600)  # До 0.05 в час
-        changes["patience"] += patience_recovery
+        changes[..., _A_LIKING] += flirtation * (2.0 * openness - 1.0) * 0.03
         
         # Применяем факторы личности персонажа
         # Персонажи, ценящие интеллект, сильнее реагируют на интеллектуальную стимуляцию
-        intellect_factor = self.personality_factors.get("intellect_appreciation", 0.5)
-        changes["respect"] *= 1.0 + intellect_factor
+        changes[..., _A_RESPECT] *= 1.0 + intellect
         
         # Персонажи с высокой чувствительностью сильнее реагируют на негативную тональность
-        sensitivity_factor = self.personality_factors.get("sensitivity", 0.5)
-        if factors.get("negative_tone", 0.0) > 0:
-            for aspect in changes:
-                changes[aspect] -= factors.get("negative_tone", 0.0) * 0.02 * sensitivity_factor
+        changes -= (negative_tone * 0.02 * sensitivity)[..., None]
         
         # Персонажи, высоко ценящие формальность, сильнее реагируют на вежливость
-        formality_factor = self.personality_factors.get("formality_preference", 0.5)
-        changes["respect"] += factors.get("politeness", 0.0) * 0.03 * formality_factor
+        changes[..., _A_RESPECT] += politeness * 0.03 * formality
+        
+        return changes
+    
+    def _add_time_changes(self, changes: np.ndarray, now: float) -> np.ndarray:
+        """
+        Добавляет к изменениям аспектов зависящие от времени составляющие
+        и ограничивает величину изменений за одно взаимодействие
+        
+        Args:
+            changes (np.ndarray): Изменения аспектов в порядке _ASPECT_ORDER (изменяется на месте)
+            now (float): Время взаимодействия
+            
+        Returns:
+            np.ndarray: Итоговые изменения аспектов
+        """
+        trust_gain, patience_gain = self._time_gains(now)
+        
+        changes[_A_TRUST] += trust_gain
+        changes[_A_PATIENCE] += patience_gain
         
         # Масштабируем изменения, чтобы они были небольшими за одно взаимодействие
-        for aspect in changes:
-            changes[aspect] = max(-0.1, min(0.1, changes[aspect]))
+        np.clip(changes, -0.1, 0.1, out=changes)
         
         return changes
     
-    def _determine_change_reason(self, factors: Dict[str, float], 
-                                aspect_changes: Dict[str, float]) -> str:
+    def _time_gains(self, now: float) -> Tuple[float, float]:
+        """
+        Рассчитывает изменения аспектов, зависящие только от времени
+        
+        Args:
+            now (float): Время взаимодействия
+            
+        Returns:
+            Tuple[float, float]: Рост доверия и восстановление терпения
+        """
+        # Доверие медленно растет со временем
+        trust_gain = min(0.01, (now - self.created_at) / (86400 * 30))  # Максимум 0.01 в месяц
+        
+        # Терпение восстанавливается со временем
+        time_since_update = now - self.last_updated
+        patience_gain = min(0.05, time_since_update / 3600)  # До 0.05 в час
+        
+        return trust_gain, patience_gain
+    
+    def _determine_change_reason(self, factor_vec: np.ndarray, changes: np.ndarray) -> str:
         """
         Определяет основную причину изменения отношений
         
         Args:
-            factors (Dict[str, float]): Факторы, влияющие на отношения
-            aspect_changes (Dict[str, float]): Изменения в аспектах отношений
+            factor_vec (np.ndarray): Факторы, влияющие на отношения, в порядке _FACTOR_ORDER
+            changes (np.ndarray): Изменения аспектов в порядке _ASPECT_ORDER
             
         Returns:
             str: Основная причина изменения
         """
-        # Определяем наиболее значимый фактор
-        significant_factor = max(factors.items(), key=lambda x: abs(x[1]))
-        
-        # Определяем аспект с наибольшим изменением
-        significant_aspect = max(aspect_changes.items(), key=lambda x: abs(x[1]))
+        # Аспект с наибольшим изменением
+        aspect_i = int(np.argmax(np.abs(changes)))
+        change = float(changes[aspect_i])
         
         # Формируем причину изменения
-        if abs(significant_aspect[1]) < 0.01:
+        if abs(change) < 0.01:
             return "Незначительное взаимодействие"
         
-        direction = "увеличение" if significant_aspect[1] > 0 else "уменьшение"
-        
-        aspect_names = {
-            "respect": "уважения",
-            "trust": "доверия",
-            "liking": "симпатии",
-            "patience": "терпения"
-        }
+        # Направление изменения, аспект и наиболее значимый фактор
+        factor_i = int(np.argmax(np.abs(factor_vec)))
+        return _CHANGE_REASONS[change > 0][aspect_i][factor_i]
+    
+    def get_status_description(self) -> Dict[str, Any]:
+        """
+        Возвращает описание текущего статуса отношений в человекочитаемом формате
         
-        factor_descriptions = {
-            "positive_tone": "позитивный тон разговора",
-            "negative_tone": "негативный тон разговора",
-            "politeness": "проявленная вежливость",
-            "intellectual_stimulation": "интеллектуальная стимуляция",
-            "user_effort": "усилия в общении",
-            "personal_address": "личное обращение",
-            "repetitive": "повторяющиеся вопросы",
-            "flirtation": "элементы флирта"
-        }
+        Описание кэшируется до следующего изменения отношений; вызывающий код
+        получает копию и может изменять ее, не затрагивая кэш.
         
-        aspect_name = aspect_names.get(significant_aspect[0], significant_aspect[0])
-        factor_desc = factor_descriptions.get(significant_factor[0], significant_factor[0])
+        Returns:
+            Dict[str, Any]: Описание статуса отношений
+        """
+        if self._cached_status_ver != self._version:
+            self._cached_status = self._build_status_description()
+            self._cached_status_ver = self._version
         
-        return f"{direction} {aspect_name} из-за фактора: {factor_desc}"
+        status = self._cached_status
+        return {
+            **status,
+            "aspects": dict(status["aspects"]),
+            "aspect_values": dict(status["aspect_values"]),
+            "last_change": dict(status["last_change"]) if status["last_change"] else None
+        }
     
-    def get_status_description(self) -> Dict[str, Any]:
+    def _build_status_description(self) -> Dict[str, Any]:
         """
-        Возвращает описание текущего статуса отношений в человекочитаемом формате
+        Составляет описание текущего статуса отношений (без кэширования)
         
         Returns:
             Dict[str, Any]: Описание статуса отношений
         """
         # Определяем общий уровень отношений
-        if self.rapport > 0.8:
-            rapport_desc = "превосходные"
-        elif self.rapport > 0.6:
-            rapport_desc = "очень хорошие"
-        elif self.rapport > 0.3:
-            rapport_desc = "хорошие"
-        elif self.rapport > 0.1:
-            rapport_desc = "положительные"
-        elif self.rapport > -0.1:
-            rapport_desc = "нейтральные"
-        elif self.rapport > -0.3:
-            rapport_desc = "напряженные"
-        elif self.rapport > -0.6:
-            rapport_desc = "плохие"
-        elif self.rapport > -0.8:
-            rapport_desc = "очень плохие"
-        else:
-            rapport_desc = "враждебные"
+        rapport_desc = self._RAPPORT_LABELS[bisect.bisect_left(self._RAPPORT_TH, self.rapport)]
         
         # Определяем описания аспектов
-        aspect_descriptions = {}
-        aspect_values = self._get_aspect_values()
-        
-        for aspect_name, aspect in self.aspects.items():
-            aspect_descriptions[aspect_name] = aspect.get_description()
+        aspect_values = self.aspects
+        aspect_descriptions = {
+            aspect_name: RelationshipAspect.describe(aspect_name, value)
+            for aspect_name, value in aspect_values.items()
+        }
         
         # Получаем последнее изменение
         last_change = self.history[-1] if self.history else None
         last_change_desc = None
         if last_change and last_change["change_magnitude"] > 0.01:
             last_change_desc = {
-                "when": last_change["datetime"],
+                # Дата форматируется только при выводе, в истории хранится метка времени
+                "when": datetime.fromtimestamp(last_change["timestamp"]).isoformat(),
                 "reason": last_change["reason"],
                 "magnitude": last_change["change_magnitude"]
             }
@@ -514,25 +1129,27 @@ class Relationship:
         Returns:
             str: Описание отношений для промпта
         """
-        status = self.get_status_description()
-        
-        summary = f"ТВОЕ ОТНОШЕНИЕ К СОБЕСЕДНИКУ: {status['overall']} (уровень: {self.rapport:.2f})\n\n"
-        
-        summary += "Аспекты отношений:\n"
-        for aspect_name, desc in status['aspects'].items():
-            aspect_name_rus = {
-                "respect": "Уважение",
-                "trust": "Доверие",
-                "liking": "Симпатия",
-                "patience": "Терпение"
-            }.get(aspect_name, aspect_name.capitalize())
-            
-            value = status['aspect_values'][aspect_name]
-            summary += f"- {aspect_name_rus}: {desc} ({value:.2f})\n"
-        
-        if status['last_change']:
-            summary += f"\nПоследнее изменение: {status['last_change']['reason']}\n"
-        
+        if self._cached_summary_ver == self._version:
+            return self._cached_summary
+        
+        # Строится напрямую, без промежуточного словаря get_status_description
+        overall = self._RAPPORT_LABELS[bisect.bisect_left(self._RAPPORT_TH, self.rapport)]
+        parts = [
+            f"ТВОЕ ОТНОШЕНИЕ К СОБЕСЕДНИКУ: {overall} (уровень: {self.rapport:.2f})\n\n",
+            "Аспекты отношений:\n"
+        ]
+        for aspect_name, value in zip(_ASPECT_ORDER, self._aspect_values.tolist()):
+            desc = RelationshipAspect.describe(aspect_name, value)
+            parts.append(f"- {_ASPECT_RU[aspect_name]}: {desc} ({value:.2f})\n")
+        
+        if self.history:
+            last_change = self.history[-1]
+            if last_change["change_magnitude"] > 0.01:
+                parts.append(f"\nПоследнее изменение: {last_change['reason']}\n")
+        
+        summary = "".join(parts)
+        self._cached_summary = summary
+        self._cached_summary_ver = self._version
         return summary
     
     def update_aspect(self, aspect_name: str, change: float) -> bool:
@@ -554,24 +1171,25 @@ class Relationship:
             self._add_to_history(
                 "Ручное изменение общего отношения", 
                 self.rapport, 
-                self._get_aspect_values(),
+                self._get_aspect_snapshot(),
                 abs(change)
             )
             return True
-        elif aspect_name in self.aspects:
+        elif aspect_name in _ASPECT_INDEX:
             # Обновляем аспект
-            actual_change = self.aspects[aspect_name].update(change)
+            i = _ASPECT_INDEX[aspect_name]
+            old_value = float(self._aspect_values[i])
+            self._aspect_values[i] = max(-1.0, min(1.0, old_value + change))
+            actual_change = float(self._aspect_values[i]) - old_value
             
             # Обновляем общее отношение
-            weighted_sum = sum(aspect.value * aspect.weight for aspect in self.aspects.values())
-            total_weight = sum(aspect.weight for aspect in self.aspects.values())
-            self.rapport = max(-1.0, min(1.0, weighted_sum / total_weight))
+            self.rapport = self._weighted_rapport()
             
             # Добавляем в историю
             self._add_to_history(
                 f"Ручное изменение аспекта {aspect_name}", 
                 self.rapport, 
-                self._get_aspect_values(),
+                self._get_aspect_snapshot(),
                 abs(actual_change)
             )
             return True
@@ -588,41 +1206,94 @@ class Relationship:
         return {
             "character_name": self.character_name,
             "rapport": self.rapport,
-            "aspects": {name: aspect.to_dict() for name, aspect in self.aspects.items()},
+            "aspects": {
+                name: RelationshipAspect(name, value, weight).to_dict()
+                for name, value, weight in zip(_ASPECT_ORDER, self._aspect_values.tolist(),
+                                               self._ASPECT_WEIGHTS.tolist())
+            },
             "personality_factors": self.personality_factors,
-            "history": self.history,
+            # При ведении истории в файле здесь только последние записи. Дата в ISO-формате
+            # (как в прежнем формате файла) вычисляется только здесь, при экспорте
+            "history": [
+                {**self._export_history_entry(entry),
+                 "datetime": datetime.fromtimestamp(entry["timestamp"]).isoformat()}
+                for entry in self.history
+            ],
             "created_at": self.created_at,
             "last_updated": self.last_updated
         }
     
+    def dumps(self) -> str:
+        """
+        Сериализует отношения в JSON-строку
+        
+        Returns:
+            str: JSON с данными отношений (см. to_dict)
+        """
+        return _dumps(self.to_dict())
+    
+    @classmethod
+    def loads(cls, data: str, history_path: Optional[str] = None) -> 'Relationship':
+        """
+        Создает объект отношений из JSON-строки
+        
+        Args:
+            data (str): JSON с данными отношений
+            history_path (str, optional): Путь к JSONL-файлу истории изменений (см. from_dict)
+            
+        Returns:
+            Relationship: Объект отношений
+        """
+        return cls.from_dict(_loads(data), history_path=history_path)
+    
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Relationship':
+    def from_dict(cls, data: Dict[str, Any], history_path: Optional[str] = None) -> 'Relationship':
         """
         Создает объект отношений из словаря
         
         Args:
             data (Dict[str, Any]): Данные отношений
+            history_path (str, optional): Путь к JSONL-файлу истории изменений.
+                Если файла еще нет, в него переносится история из словаря
             
         Returns:
             Relationship: Объект отношений
         """
+        # Значения аспектов передаются в конструктор напрямую, без промежуточных
+        # объектов RelationshipAspect (веса аспектов фиксированы и из данных не берутся)
+        initial_aspects = {}
+        for name, aspect_data in data.get("aspects", {}).items():
+            if name not in _ASPECT_INDEX:
+                logger.warning(f"Неизвестный аспект отношений пропущен: {name}")
+                continue
+            if isinstance(aspect_data, dict):
+                initial_aspects[name] = aspect_data.get("value", 0.0)
+            else:
+                # Обратная совместимость со старым форматом
+                initial_aspects[name] = aspect_data
+        
         relationship = cls(
             character_name=data.get("character_name", "Unknown"),
             initial_rapport=data.get("rapport", 0.0),
+            initial_aspects=initial_aspects,
             personality_factors=data.get("personality_factors", {})
         )
         
-        # Загружаем аспекты
-        if "aspects" in data:
-            for name, aspect_data in data["aspects"].items():
-                if isinstance(aspect_data, dict):
-                    relationship.aspects[name] = RelationshipAspect.from_dict(aspect_data)
-                else:
-                    # Обратная совместимость со старым форматом
-                    relationship.aspects[name] = RelationshipAspect(name, aspect_data)
-        
-        relationship.history = data.get("history", [])
-        relationship.created_at = data.get("created_at", time.time())
-        relationship.last_updated = data.get("last_updated", time.time())
+        history = [cls._import_history_entry(entry) for entry in data.get("history", [])]
+        if history_path:
+            relationship.history_path = history_path
+            relationship.history = RelationshipHistory(cls.HISTORY_TAIL)
+            if os.path.exists(history_path):
+                history = relationship._read_history_tail()
+            else:
+                # Переносим историю из старого формата в файл
+                relationship._write_history(history)
+        else:
+            relationship.history = RelationshipHistory(cls.HISTORY_LIMIT)
+        relationship.history.extend(history)
+        # По умолчанию - метки, выставленные конструктором
+        relationship.created_at = data.get("created_at", relationship.created_at)
+        relationship.last_updated = data.get("last_updated", relationship.last_updated)
+        relationship._version += 1
         
         return relationship
\ No newline at end of file
@@ -9,18 +9,82 @@ import os
 import json
 import time
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import Dict, Any, Optional
 
 from agent import CharacterAgent
 from characters import list_characters, get_character
+from memory.vector_index import VectorIndex
+from file_utils import atomic_write_bytes
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+
+def _dumps_json(data: Any) -> bytes:
+    """
+    Сериализует данные в JSON с отступами (через orjson, если он установлен)
+    
+    Args:
+        data (Any): Данные для сериализации
+        
+    Returns:
+        bytes: JSON в кодировке UTF-8
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def _loads_json(data: bytes) -> Any:
+    """
+    Разбирает JSON (через orjson, если он установлен)
+    
+    Args:
+        data (bytes): JSON в кодировке UTF-8
+        
+    Returns:
+        Any: Разобранные данные
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def _atomic_write_json(path: str, data: Any) -> None:
+    """
+    Атомарно записывает данные в JSON-файл, так что при сбое файл не остается обрезанным
+    
+    Args:
+        path (str): Путь к файлу
+        data (Any): Данные для сохранения
+    """
+    atomic_write_bytes(path, _dumps_json(data))
+
+
 class SessionManager:
     """
     Управляет сессиями пользователей для Telegram бота
     """
     
+    # Минимальный интервал между очистками неактивных сессий (в секундах)
+    CLEANUP_INTERVAL = 60
+    
+    # Файл с информацией об активных сессиях
+    SESSIONS_FILE = "config/active_sessions.json"
+    
+    # Задержка сохранения агента после смены персонажа (в секундах), см. _schedule_save
+    SAVE_DELAY = 5
+    
+    # Количество рабочих потоков для обработки сообщений (см. submit_message)
+    MAX_WORKERS = 4
+    
     def __init__(self, config_path="config/bot_config.json"):
         """
         Инициализация менеджера сессий
@@ -29,13 +93,53 @@ class SessionManager:
             config_path (str): Путь к файлу конфигурации
         """
         self.config_path = config_path
-        self.active_sessions = {}  # user_id -> {character_name, agent, last_active}
+        
+        # Директории создаются один раз при запуске (конфигурация может сохраняться
+        # уже при загрузке, см. _load_config), а не при каждом сохранении
+        for directory in {"character_states", os.path.dirname(config_path), os.path.dirname(self.SESSIONS_FILE)}:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        
+        # user_id -> {character_name, agent, last_active}, от давно неактивных к недавним
+        self.active_sessions = OrderedDict()
         self.default_character = "Шерлок Холмс"
         self.config = self._load_config()
         
-        # Создаем директорию для сессий, если она не существует
-        os.makedirs("character_states", exist_ok=True)
-        os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        # Параметры новых агентов из конфигурации (с учетом значений по умолчанию)
+        # вычисляются один раз, а не при создании каждого агента
+        self._agent_settings = {
+            "model_name": self.config.get("default_embedding_model", "paraphrase-multilingual-MiniLM-L12-v2"),
+            "index_type": self.config.get("default_index_type", "flat"),
+            "use_cosine": True,
+            "style_level": self.config.get("default_style_level", "high"),
+            "llm_provider": self.config.get("default_llm_provider", "openai"),
+            "llm_model": self.config.get("default_llm_model", "gpt-4o-mini")
+        }
+        
+        # Изменения сессий сохраняются в файл не чаще раза в auto_save_interval (см. _mark_sessions_dirty);
+        # одно лишь обновление времени активности сохраняется при flush и save_all_sessions
+        self._sessions_dirty = False
+        self._sessions_touched = False
+        self._last_sessions_flush = time.monotonic()
+        self._last_cleanup = 0.0
+        
+        # Загрузка агентов и ответы LLM выполняются в рабочих потоках, чтобы не блокировать
+        # цикл событий бота. Общая блокировка защищает только словари сессий и удерживается
+        # недолго; запрос к LLM и изменения агента выполняются под блокировкой пользователя
+        # (см. get_user_lock), поэтому пользователи не ждут друг друга
+        self._lock = threading.RLock()
+        self._user_locks = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="session")
+        
+        # Модель эмбеддингов и FAISS делят ядра между рабочими потоками
+        VectorIndex.concurrency = self.MAX_WORKERS
+        
+        # Отложенные сохранения агентов: (user_id, character_name) -> (таймер, агент)
+        self._pending_saves = {}
+        
+        # Блокировки состояния агентов на диске: (user_id, character_name) -> блокировка.
+        # Упорядочивают сохранение агента и повторную загрузку того же агента
+        self._agent_locks = {}
         
         # Загружаем активные сессии, если они есть
         self._load_active_sessions()
@@ -56,6 +160,7 @@ class SessionManager:
             "default_style_level": "high",
             "default_index_type": "flat",
             "session_timeout": 86400,  # 24 часа
+            "agent_idle_timeout": 900,  # 15 минут
             "auto_save_interval": 600,  # 10 минут
             "max_inactive_sessions": 100
         }
@@ -63,13 +168,12 @@ class SessionManager:
         try:
             # Проверяем, существует ли файл конфигурации
             if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
+                with open(self.config_path, 'rb') as f:
+                    loaded_config = _loads_json(f.read())
                     config.update(loaded_config)
             else:
                 # Если файл не существует, создаем его с настройками по умолчанию
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=2)
+                _atomic_write_json(self.config_path, config)
         except Exception as e:
             logger.error(f"Ошибка при загрузке конфигурации: {str(e)}")
         
@@ -84,8 +188,7 @@ class SessionManager:
             bool: True если успешно, False в противном случае
         """
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
+            _atomic_write_json(self.config_path, self.config)
             return True
         except Exception as e:
             logger.error(f"Ошибка при сохранении конфигурации: {str(e)}")
@@ -95,24 +198,29 @@ class SessionManager:
         """
         Загружает информацию об активных сессиях из файла
         """
-        sessions_file = "config/active_sessions.json"
+        sessions_file = self.SESSIONS_FILE
         try:
             if os.path.exists(sessions_file):
-                with open(sessions_file, 'r', encoding='utf-8') as f:
-                    sessions_data = json.load(f)
+                with open(sessions_file, 'rb') as f:
+                    sessions_data = _loads_json(f.read())
+                
+                # Отбрасываем устаревшие сессии до сортировки
+                cutoff = time.time() - self.config["session_timeout"]
+                live_sessions = [
+                    (session_info.get("last_active", 0), user_id, session_info)
+                    for user_id, session_info in sessions_data.items()
+                    if session_info.get("last_active", 0) > cutoff
+                ]
+                live_sessions.sort(key=lambda x: x[0])
                 
                 # Загружаем информацию о сессиях, но не создаем агентов
-                for user_id, session_info in sessions_data.items():
-                    character_name = session_info.get("character_name", self.default_character)
-                    last_active = session_info.get("last_active", 0)
-                    
-                    # Проверяем, не устарела ли сессия
-                    if time.time() - last_active < self.config["session_timeout"]:
-                        self.active_sessions[user_id] = {
-                            "character_name": character_name,
-                            "agent": None,  # Агент будет создан при первом обращении
-                            "last_active": last_active
-                        }
+                # (в порядке последней активности, см. active_sessions)
+                for last_active, user_id, session_info in live_sessions:
+                    self.active_sessions[user_id] = {
+                        "character_name": session_info.get("character_name", self.default_character),
+                        "agent": None,  # Агент будет создан при первом обращении
+                        "last_active": last_active
+                    }
         except Exception as e:
             logger.error(f"Ошибка при загрузке активных сессий: {str(e)}")
     
@@ -123,11 +231,8 @@ class SessionManager:
         Returns:
             bool: True если успешно, False в противном случае
         """
-        sessions_file = "config/active_sessions.json"
+        sessions_file = self.SESSIONS_FILE
         try:
-            # Создаем директорию, если она не существует
-            os.makedirs(os.path.dirname(sessions_file), exist_ok=True)
-            
             # Подготавливаем данные для сохранения
             sessions_data = {}
             for user_id, session in self.active_sessions.items():
@@ -137,13 +242,172 @@ class SessionManager:
                 }
             
             # Сохраняем данные в файл
-            with open(sessions_file, 'w', encoding='utf-8') as f:
-                json.dump(sessions_data, f, ensure_ascii=False, indent=2)
+            _atomic_write_json(sessions_file, sessions_data)
+            self._sessions_dirty = False
+            self._sessions_touched = False
+            self._last_sessions_flush = time.monotonic()
             return True
         except Exception as e:
             logger.error(f"Ошибка при сохранении активных сессий: {str(e)}")
             return False
     
+    def _mark_sessions_dirty(self) -> None:
+        """
+        Отмечает, что набор сессий или персонаж сессии изменились. Файл сессий
+        перезаписывается, только если с последнего сохранения прошло больше
+        auto_save_interval секунд; остальные изменения сохраняет flush
+        """
+        self._sessions_dirty = True
+        if time.monotonic() - self._last_sessions_flush > self.config["auto_save_interval"]:
+            self._save_active_sessions()
+    
+    def flush(self) -> bool:
+        """
+        Сохраняет информацию об активных сессиях, если она изменилась
+        с последнего сохранения
+        
+        Returns:
+            bool: True если сохранять было нечего или сохранение успешно
+        """
+        with self._lock:
+            if not (self._sessions_dirty or self._sessions_touched):
+                return True
+            return self._save_active_sessions()
+    
+    def close(self) -> None:
+        """
+        Дожидается обработки отправленных сообщений и сохраняет изменения сессий
+        """
+        self._executor.shutdown(wait=True)
+        self._flush_pending_saves()
+        self.flush()
+    
+    def _schedule_save(self, user_id: str, character_name: str, agent: CharacterAgent) -> None:
+        """
+        Откладывает сохранение агента на SAVE_DELAY секунд, чтобы смена персонажа
+        не ждала записи индекса и истории на диск
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+            character_name (str): Имя персонажа агента
+            agent (CharacterAgent): Агент для сохранения
+        """
+        key = (user_id, character_name)
+        with self._lock:
+            pending = self._pending_saves.get(key)
+            if pending is not None:
+                pending[0].cancel()
+            timer = threading.Timer(self.SAVE_DELAY, self._run_pending_save, args=(key,))
+            timer.daemon = True
+            self._pending_saves[key] = (timer, agent)
+            timer.start()
+    
+    def _get_agent_lock(self, key: tuple) -> threading.RLock:
+        """
+        Возвращает блокировку состояния агента на диске
+        
+        Args:
+            key (tuple): Пара (user_id, character_name)
+            
+        Returns:
+            threading.RLock: Блокировка агента
+        """
+        with self._lock:
+            lock = self._agent_locks.get(key)
+            if lock is None:
+                lock = self._agent_locks[key] = threading.RLock()
+            return lock
+    
+    def _run_pending_save(self, key: tuple) -> None:
+        """
+        Выполняет отложенное сохранение агента, если оно еще не выполнено.
+        Запись на диск идет вне общей блокировки, под блокировкой агента
+        
+        Args:
+            key (tuple): Пара (user_id, character_name)
+        """
+        with self._get_agent_lock(key):
+            with self._lock:
+                pending = self._pending_saves.pop(key, None)
+            if pending is None:
+                return
+            timer, agent = pending
+            if timer is not None:
+                timer.cancel()
+            try:
+                agent.save_state()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояния агента: {str(e)}")
+    
+    def _flush_pending_saves(self, keys: Optional[list] = None) -> None:
+        """
+        Немедленно выполняет отложенные сохранения агентов
+        
+        Args:
+            keys (list, optional): Ключи (user_id, character_name) сохранений (по умолчанию все)
+        """
+        if keys is None:
+            with self._lock:
+                keys = list(self._pending_saves)
+        for key in keys:
+            self._run_pending_save(key)
+    
+    def _defer_save(self, user_id: str, character_name: str, agent: CharacterAgent) -> tuple:
+        """
+        Регистрирует сохранение выгружаемого агента без таймера. Вызывается под общей
+        блокировкой; само сохранение выполняет _flush_pending_saves после ее освобождения
+        (или _create_agent, если агент понадобится раньше)
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+            character_name (str): Имя персонажа агента
+            agent (CharacterAgent): Агент для сохранения
+            
+        Returns:
+            tuple: Ключ (user_id, character_name) сохранения
+        """
+        key = (user_id, character_name)
+        pending = self._pending_saves.get(key)
+        if pending is not None and pending[0] is not None:
+            pending[0].cancel()
+        self._pending_saves[key] = (None, agent)
+        return key
+    
+    def get_user_lock(self, user_id: str) -> threading.RLock:
+        """
+        Возвращает блокировку пользователя. Под ней выполняются запрос к LLM и команды,
+        изменяющие агента, чтобы один агент не менялся из нескольких потоков одновременно
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+            
+        Returns:
+            threading.RLock: Блокировка пользователя
+        """
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.RLock()
+            return lock
+    
+    def _is_busy(self, user_id: str) -> bool:
+        """
+        Проверяет, занят ли агент пользователя другим потоком (запрос к LLM или команда)
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+            
+        Returns:
+            bool: True если блокировку пользователя удерживает другой поток
+        """
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            return False
+        if not lock.acquire(blocking=False):
+            return True
+        lock.release()
+        return False
+    
     def get_agent_for_user(self, user_id: str, character_name: Optional[str] = None) -> CharacterAgent:
         """
         Получает или создает агента для пользователя
@@ -155,51 +419,65 @@ class SessionManager:
         Returns:
             CharacterAgent: Агент
         """
-        # Если имя персонажа не указано, используем текущего или по умолчанию
-        if character_name is None:
-            if user_id in self.active_sessions:
-                character_name = self.active_sessions[user_id]["character_name"]
-            else:
-                character_name = self.default_character
-        
-        # Проверяем, существует ли персонаж
-        if not get_character(character_name):
-            logger.warning(f"Персонаж '{character_name}' не найден. Используем '{self.default_character}'")
-            character_name = self.default_character
-        
-        # Проверяем, есть ли сессия для этого пользователя
-        if user_id in self.active_sessions:
-            session = self.active_sessions[user_id]
-            
-            # Если нужно сменить персонажа
-            if character_name != session["character_name"]:
-                # Сохраняем текущего агента, если он есть
-                if session["agent"] is not None:
-                    session["agent"].save_state()
+        # Сессию пользователя меняет только поток, удерживающий его блокировку;
+        # общая блокировка берется лишь на время работы со словарем сессий
+        with self.get_user_lock(user_id):
+            with self._lock:
+                session = self.active_sessions.get(user_id)
                 
-                # Создаем нового агента
-                session["agent"] = self._create_agent(character_name, user_id)
-                session["character_name"] = character_name
+                # Если имя персонажа не указано, используем текущего или по умолчанию
+                if character_name is None:
+                    character_name = session["character_name"] if session is not None else self.default_character
+                
+                # Проверяем, существует ли персонаж
+                if not get_character(character_name):
+                    logger.warning(f"Персонаж '{character_name}' не найден. Используем '{self.default_character}'")
+                    character_name = self.default_character
+                
+                agent = None
+                if session is not None and session["character_name"] == character_name:
+                    agent = session["agent"]
             
-            # Если агент еще не создан, создаем его
-            elif session["agent"] is None:
-                session["agent"] = self._create_agent(character_name, user_id)
+            # Агент создается вне общей блокировки: загрузка модели и индекса
+            # не задерживает запросы других пользователей
+            if agent is None:
+                agent = self._create_agent(character_name, user_id)
             
-            # Обновляем время последней активности
-            session["last_active"] = time.time()
-        else:
-            # Создаем новую сессию
-            agent = self._create_agent(character_name, user_id)
-            self.active_sessions[user_id] = {
-                "character_name": character_name,
-                "agent": agent,
-                "last_active": time.time()
-            }
+            with self._lock:
+                session = self.active_sessions.get(user_id)
+                if session is None:
+                    # Создаем новую сессию
+                    self.active_sessions[user_id] = {
+                        "character_name": character_name,
+                        "agent": agent,
+                        "last_active": time.time()
+                    }
+                    self._mark_sessions_dirty()
+                else:
+                    # Если нужно сменить персонажа
+                    if character_name != session["character_name"]:
+                        # Сохраняем текущего агента, если он есть (отложенно: при быстрой
+                        # смене персонажей команда не ждет записи на диск)
+                        if session["agent"] is not None:
+                            self._schedule_save(user_id, session["character_name"], session["agent"])
+                        session["character_name"] = character_name
+                        self._mark_sessions_dirty()
+                    
+                    session["agent"] = agent
+                    
+                    # Обновляем время последней активности
+                    self._touch_session(user_id)
+                
+                # Периодически чистим неактивные сессии
+                unloaded = self._cleanup_sessions()
         
-        # Периодически чистим неактивные сессии и сохраняем состояние
-        self._cleanup_sessions()
+        # Выгруженные агенты сохраняются в фоновом потоке, вне блокировок
+        # (не демоническом: при завершении процесса запись дойдет до конца)
+        if unloaded:
+            threading.Thread(target=self._flush_pending_saves, args=(unloaded,),
+                             name="session-save").start()
         
-        return self.active_sessions[user_id]["agent"]
+        return agent
     
     def _create_agent(self, character_name: str, user_id: str) -> CharacterAgent:
         """
@@ -212,20 +490,24 @@ class SessionManager:
         Returns:
             CharacterAgent: Созданный агент
         """
-        try:
-            return CharacterAgent.load_or_create(
-                character_name=character_name,
-                user_id=user_id,
-                model_name=self.config.get("default_embedding_model", "paraphrase-multilingual-MiniLM-L12-v2"),
-                index_type=self.config.get("default_index_type", "flat"),
-                use_cosine=True,
-                style_level=self.config.get("default_style_level", "high"),
-                llm_provider=self.config.get("default_llm_provider", "openai"),
-                llm_model=self.config.get("default_llm_model", "gpt-4o-mini")
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при создании агента: {str(e)}")
-            # Пытаемся создать агента с дефолтными параметрами в случае ошибки
+        # Состояние этого же агента могло еще не сохраниться после смены персонажа:
+        # сохранение выполняется до загрузки, а блокировка агента не дает загрузить
+        # состояние, пока его сохранение идет в другом потоке
+        with self._get_agent_lock((user_id, character_name)):
+            self._run_pending_save((user_id, character_name))
+            
+            try:
+                return CharacterAgent.load_or_create(
+                    character_name=character_name,
+                    user_id=user_id,
+                    **self._agent_settings
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при создании агента: {str(e)}")
+        
+        # Пытаемся создать агента с дефолтными параметрами в случае ошибки
+        with self._get_agent_lock((user_id, self.default_character)):
+            self._run_pending_save((user_id, self.default_character))
             return CharacterAgent.load_or_create(
                 character_name=self.default_character,
                 user_id=user_id
@@ -243,16 +525,51 @@ class SessionManager:
         Returns:
             str: Ответ персонажа
         """
-        # Получаем агента для пользователя
-        agent = self.get_agent_for_user(user_id, character_name)
+        with self.get_user_lock(user_id):
+            # Получаем агента для пользователя
+            agent = self.get_agent_for_user(user_id, character_name)
+            
+            # Обрабатываем сообщение
+            response = agent.process_message(message_text)
+            
+            # Обновляем время последней активности
+            with self._lock:
+                if user_id in self.active_sessions:
+                    self._touch_session(user_id)
         
-        # Обрабатываем сообщение
-        response = agent.process_message(message_text)
+        return response
+    
+    def call_with_agent(self, user_id: str, func, *args, **kwargs) -> Any:
+        """
+        Вызывает func(agent, *args, **kwargs) для агента пользователя под блокировкой
+        пользователя, чтобы команды не меняли агента во время обработки сообщения
         
-        # Обновляем время последней активности
-        self.active_sessions[user_id]["last_active"] = time.time()
+        Args:
+            user_id (str): Идентификатор пользователя
+            func (Callable): Функция, принимающая агента первым аргументом
+            *args: Дополнительные позиционные аргументы func
+            **kwargs: Дополнительные именованные аргументы func
+            
+        Returns:
+            Any: Результат func
+        """
+        with self.get_user_lock(user_id):
+            return func(self.get_agent_for_user(user_id), *args, **kwargs)
+    
+    def submit_message(self, user_id: str, message_text: str, character_name: Optional[str] = None) -> Future:
+        """
+        Отправляет сообщение пользователя на обработку в рабочий поток. Создание агента
+        (загрузка модели эмбеддингов и индекса) и запрос к LLM не блокируют вызывающий поток
         
-        return response
+        Args:
+            user_id (str): Идентификатор пользователя
+            message_text (str): Текст сообщения
+            character_name (str, optional): Имя персонажа (если None, используется текущий)
+            
+        Returns:
+            Future: Будущий ответ персонажа (см. process_message)
+        """
+        return self._executor.submit(self.process_message, user_id, message_text, character_name)
     
     def change_character(self, user_id: str, character_name: str) -> bool:
         """
@@ -271,7 +588,6 @@ class SessionManager:
         
         # Получаем агента для нового персонажа (это автоматически сменит персонажа)
         self.get_agent_for_user(user_id, character_name)
-        self._save_active_sessions()
         
         return True
     
@@ -279,50 +595,126 @@ class SessionManager:
         """
         Сохраняет состояние всех активных сессий
         """
-        for user_id, session in self.active_sessions.items():
-            if session["agent"] is not None:
-                session["agent"].save_state()
+        self.save_sessions()
+    
+    def save_sessions(self, user_ids: Optional[set] = None) -> None:
+        """
+        Сохраняет состояние агентов указанных пользователей и информацию об активных сессиях
+        
+        Args:
+            user_ids (set, optional): Идентификаторы пользователей; None - все активные сессии
+        """
+        self._flush_pending_saves()
         
-        self._save_active_sessions()
-        logger.info(f"Сохранены все активные сессии ({len(self.active_sessions)})")
+        with self._lock:
+            agents = [(user_id, session["agent"]) for user_id, session in self.active_sessions.items()
+                      if session["agent"] is not None and (user_ids is None or user_id in user_ids)]
+        
+        # Агенты сохраняются параллельно и вне общей блокировки: сохранение упирается
+        # в запись на диск. Каждый агент сохраняется под блокировкой своего пользователя,
+        # чтобы не записывать его во время обработки сообщения
+        if agents:
+            with ThreadPoolExecutor(max_workers=min(32, len(agents))) as pool:
+                futures = [pool.submit(self._save_agent, user_id, agent) for user_id, agent in agents]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Ошибка при сохранении состояния агента: {str(e)}")
+        
+        with self._lock:
+            self._save_active_sessions()
+            logger.info(f"Сохранены агенты активных сессий: {len(agents)} из {len(self.active_sessions)}")
     
-    def _cleanup_sessions(self) -> None:
+    def _save_agent(self, user_id: str, agent: CharacterAgent) -> None:
         """
-        Очищает неактивные сессии и сохраняет остальные
+        Сохраняет состояние агента сессии под блокировками пользователя и агента
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+            agent (CharacterAgent): Агент
         """
+        with self.get_user_lock(user_id), self._get_agent_lock((user_id, agent.character_name)):
+            agent.save_state()
+    
+    def _touch_session(self, user_id: str) -> None:
+        """
+        Обновляет время последней активности сессии и переносит ее в конец active_sessions
+        
+        Args:
+            user_id (str): Идентификатор пользователя
+        """
+        self.active_sessions[user_id]["last_active"] = time.time()
+        self.active_sessions.move_to_end(user_id)
+        self._sessions_touched = True
+    
+    def _evict_oldest_session(self) -> Optional[tuple]:
+        """
+        Удаляет самую давно неактивную сессию; состояние ее агента сохраняется отложенно
+        
+        Returns:
+            tuple: Ключ отложенного сохранения агента или None, если агента нет
+        """
+        user_id, session = self.active_sessions.popitem(last=False)
+        if session["agent"] is None:
+            return None
+        return self._defer_save(user_id, session["character_name"], session["agent"])
+    
+    def _cleanup_sessions(self) -> list:
+        """
+        Очищает неактивные сессии и выгружает агентов простаивающих сессий
+        (не чаще раза в CLEANUP_INTERVAL секунд)
+        
+        Сессии упорядочены по последней активности, поэтому просматриваются
+        только устаревшие, лишние и простаивающие сессии в начале active_sessions.
+        Вызывается под общей блокировкой, поэтому агенты здесь не сохраняются:
+        их сохранения регистрируются и выполняются вызывающим после освобождения блокировки
+        
+        Returns:
+            list: Ключи отложенных сохранений выгруженных агентов
+        """
+        if time.monotonic() - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return []
+        self._last_cleanup = time.monotonic()
+        
         current_time = time.time()
-        sessions_to_remove = []
+        removed = False
+        unloaded = []
+        
+        # Удаляем устаревшие сессии (агент, занятый другим потоком, удалится при следующей очистке)
+        while self.active_sessions:
+            user_id, oldest = next(iter(self.active_sessions.items()))
+            if current_time - oldest["last_active"] <= self.config["session_timeout"] or self._is_busy(user_id):
+                break
+            key = self._evict_oldest_session()
+            if key is not None:
+                unloaded.append(key)
+            removed = True
+        
+        # Ограничиваем общее количество сессий, удаляя наименее активные
+        while len(self.active_sessions) > self.config["max_inactive_sessions"]:
+            if self._is_busy(next(iter(self.active_sessions))):
+                break
+            key = self._evict_oldest_session()
+            if key is not None:
+                unloaded.append(key)
+            removed = True
         
-        # Находим устаревшие сессии
+        # Выгружаем агентов давно неактивных сессий: сессия остается и агент
+        # будет создан заново при следующем обращении
+        idle_timeout = self.config.get("agent_idle_timeout", 900)
         for user_id, session in self.active_sessions.items():
-            if current_time - session["last_active"] > self.config["session_timeout"]:
-                sessions_to_remove.append(user_id)
-        
-        # Удаляем устаревшие сессии
-        for user_id in sessions_to_remove:
-            if self.active_sessions[user_id]["agent"] is not None:
-                self.active_sessions[user_id]["agent"].save_state()
-            del self.active_sessions[user_id]
-        
-        # Ограничиваем общее количество сессий
-        if len(self.active_sessions) > self.config["max_inactive_sessions"]:
-            # Сортируем сессии по времени последней активности
-            sorted_sessions = sorted(
-                self.active_sessions.items(), 
-                key=lambda x: x[1]["last_active"]
-            )
-            
-            # Удаляем наименее активные сессии
-            excess_count = len(self.active_sessions) - self.config["max_inactive_sessions"]
-            for i in range(excess_count):
-                user_id, session = sorted_sessions[i]
-                if session["agent"] is not None:
-                    session["agent"].save_state()
-                del self.active_sessions[user_id]
-        
-        # Сохраняем активные сессии
-        if sessions_to_remove or len(self.active_sessions) > self.config["max_inactive_sessions"]:
-            self._save_active_sessions()
+            if current_time - session["last_active"] <= idle_timeout:
+                break
+            if session["agent"] is not None and not self._is_busy(user_id):
+                unloaded.append(self._defer_save(user_id, session["character_name"], session["agent"]))
+                session["agent"] = None
+        
+        # Отмечаем изменение активных сессий
+        if removed:
+            self._mark_sessions_dirty()
+        
+        return unloaded
     
     def get_available_characters(self):
         """
@@ -2,6 +2,8 @@
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from file_utils import safe_name
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +20,16 @@ def setup_directories():
         from characters import list_characters
         
         characters = list_characters()
+        char_dirs = {}
         for name, _ in characters:
-            # Формируем безопасное имя файла
-            safe_name = "".join(c if c.isalnum() else "_" for c in name)
-            char_dir = os.path.join("character_states", safe_name)
-            os.makedirs(char_dir, exist_ok=True)
+            char_dirs[name] = os.path.join("character_states", safe_name(name))
+        
+        # Директории создаются параллельно: на медленных (сетевых) файловых системах
+        # время уходит на ожидание системных вызовов
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda path: os.makedirs(path, exist_ok=True), char_dirs.values()))
+        
+        for name, char_dir in char_dirs.items():
             logger.info(f"Создана директория для персонажа '{name}': {char_dir}")
     except ImportError:
         logger.warning("Не удалось импортировать модуль персонажей")
@@ -10,6 +10,8 @@ import json
 import logging
 import re
 import asyncio
+from functools import lru_cache
+from itertools import chain
 from datetime import datetime
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -19,6 +21,11 @@ from session_manager import SessionManager
 from characters import get_character
 from llm_provider import list_available_providers
 
+try:
+    import uvloop
+except ImportError:  # uvloop необязателен: без него используется стандартный цикл событий asyncio
+    uvloop = None
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -38,12 +45,85 @@ if not TOKEN:
     logger.error("Не найден токен Telegram бота. Установите переменную окружения TELEGRAM_BOT_TOKEN.")
     raise ValueError("Не найден токен Telegram бота. Пожалуйста, установите переменную окружения TELEGRAM_BOT_TOKEN.")
 
+# Статичные тексты команд собираются один раз при импорте модуля
+_HELP_TEXT = (
+    "Доступные команды:\n\n"
+    "/start - Начать общение\n"
+    "/help - Показать это сообщение\n"
+    "/character [имя персонажа] - Сменить персонажа\n"
+    "/characters - Показать список доступных персонажей\n"
+    "/model [провайдер] [модель] - Выбрать провайдера и модель LLM\n"
+    "/relationship - Посмотреть текущие отношения персонажа к вам\n"
+    "/relation_change [аспект] [изменение] - Изменить отношение персонажа\n"
+    "  Аспекты: rapport, respect, trust, liking, patience\n"
+    "  Изменение: число от -0.3 до 0.3\n"
+    "  Пример: /relation_change respect 0.1\n"
+    "/memories - Показать список эпизодических воспоминаний\n"
+    "/memory_add [текст] [важность] - Добавить воспоминание\n"
+    "  Важность: число от 0.1 до 0.9\n"
+    "  Пример: /memory_add 'Мы говорили о музыке' 0.5\n"
+    "/memory_clear - Очистить эпизодическую память\n"
+    "/save - Сохранить текущее состояние\n"
+    "/providers - Показать доступные LLM провайдеры\n\n"
+    "Просто отправьте сообщение, чтобы пообщаться с текущим персонажем."
+)
+
+def _build_providers_text():
+    """Формирует текст команды /providers (список провайдеров задается статично)"""
+    lines = ["Доступные LLM провайдеры:", ""]
+    
+    for provider, info in list_available_providers().items():
+        lines.append(f"• {provider.upper()}: {info['description']}")
+        lines.append("  Модели:")
+        lines.extend(f"  - {model}" for model in info['models'])
+        lines.append("")
+    
+    lines.append("Используйте команду /model [провайдер] [модель] для смены модели.")
+    return "\n".join(lines)
+
+_PROVIDERS_TEXT = _build_providers_text()
+
+# Названия аспектов отношений для команд /relationship и /relation_change
+_ASPECT_TITLES = {
+    "respect": "Уважение",
+    "trust": "Доверие",
+    "liking": "Симпатия",
+    "patience": "Терпение"
+}
+_ASPECT_NAMES = {"rapport": "Общее отношение", **_ASPECT_TITLES}
+_VALID_ASPECTS = frozenset(_ASPECT_NAMES)
+
+@lru_cache(maxsize=1)
+def _character_table():
+    """
+    Таблица персонажей для команды /characters, строится один раз
+    
+    Returns:
+        tuple: Кортежи (имя, эпоха, описание)
+    """
+    return tuple(
+        (name, getattr(get_character(name), 'era', "Неизвестная эпоха"), desc)
+        for name, desc in session_manager.get_available_characters()
+    )
+
+@lru_cache(maxsize=1)
+def _name_index():
+    """
+    Имена персонажей и их варианты в нижнем регистре для нечеткого поиска
+    
+    Returns:
+        tuple: (имена, имена в нижнем регистре)
+    """
+    names = tuple(name for name, _, _ in _character_table())
+    return names, tuple(name.lower() for name in names)
+
+@lru_cache(maxsize=4096)
 def format_timestamp(timestamp_str):
-    """Преобразует ISO timestamp в читаемый формат"""
+    """Преобразует ISO timestamp в читаемый формат (результат кэшируется по строке)"""
     try:
         dt = datetime.fromisoformat(timestamp_str)
         return dt.strftime("%d.%m.%Y %H:%M")
-    except:
+    except (ValueError, TypeError):
         return timestamp_str
 
 # Обработчики команд
@@ -52,9 +132,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     user_id = str(user.id)
     
-    # Получаем агента для пользователя с персонажем по умолчанию
-    agent = session_manager.get_agent_for_user(user_id)
+    # Получаем агента для пользователя с персонажем по умолчанию (загрузка агента
+    # и ожидание блокировки сессий выполняются в рабочем потоке)
+    agent = await asyncio.to_thread(session_manager.get_agent_for_user, user_id)
     character_name = agent.character_name
+    _mark_sessions_changed(user_id)
     
     # Приветственное сообщение
     welcome_text = (
@@ -69,66 +151,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /help"""
-    help_text = (
-        "Доступные команды:\n\n"
-        "/start - Начать общение\n"
-        "/help - Показать это сообщение\n"
-        "/character [имя персонажа] - Сменить персонажа\n"
-        "/characters - Показать список доступных персонажей\n"
-        "/model [провайдер] [модель] - Выбрать провайдера и модель LLM\n"
-        "/relationship - Посмотреть текущие отношения персонажа к вам\n"
-        "/relation_change [аспект] [изменение] - Изменить отношение персонажа\n"
-        "  Аспекты: rapport, respect, trust, liking, patience\n"
-        "  Изменение: число от -0.3 до 0.3\n"
-        "  Пример: /relation_change respect 0.1\n"
-        "/memories - Показать список эпизодических воспоминаний\n"
-        "/memory_add [текст] [важность] - Добавить воспоминание\n"
-        "  Важность: число от 0.1 до 0.9\n"
-        "  Пример: /memory_add 'Мы говорили о музыке' 0.5\n"
-        "/memory_clear - Очистить эпизодическую память\n"
-        "/save - Сохранить текущее состояние\n"
-        "/providers - Показать доступные LLM провайдеры\n\n"
-        "Просто отправьте сообщение, чтобы пообщаться с текущим персонажем."
-    )
-    
-    await update.message.reply_text(help_text)
+    await update.message.reply_text(_HELP_TEXT)
 
 async def characters_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /characters - показывает список доступных персонажей"""
-    available_characters = session_manager.get_available_characters()
-    
-    characters_text = "Доступные персонажи:\n\n"
-    
-    for name, desc in available_characters:
-        # Получаем персонажа для определения эпохи
-        character = get_character(name)
-        era = character.era if hasattr(character, 'era') else "Неизвестная эпоха"
-        
-        characters_text += f"• {name} ({era})\n"
-        characters_text += f"  {desc}\n\n"
-    
-    characters_text += "Используйте команду /character [имя персонажа] для смены персонажа."
+    characters_text = "".join(
+        f"• {name} ({era})\n  {desc}\n\n" for name, era, desc in _character_table()
+    )
     
-    await update.message.reply_text(characters_text)
+    await update.message.reply_text(
+        "Доступные персонажи:\n\n"
+        + characters_text
+        + "Используйте команду /character [имя персонажа] для смены персонажа."
+    )
 
 async def providers_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /providers - показывает список доступных LLM провайдеров"""
-    available_providers = list_available_providers()
-    
-    providers_text = "Доступные LLM провайдеры:\n\n"
-    
-    for provider, info in available_providers.items():
-        providers_text += f"• {provider.upper()}: {info['description']}\n"
-        providers_text += "  Модели:\n"
-        
-        for model in info['models']:
-            providers_text += f"  - {model}\n"
-        
-        providers_text += "\n"
-    
-    providers_text += "Используйте команду /model [провайдер] [модель] для смены модели."
-    
-    await update.message.reply_text(providers_text)
+    await update.message.reply_text(_PROVIDERS_TEXT)
 
 async def character_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /character [имя персонажа]"""
@@ -137,29 +176,27 @@ async def character_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Если аргументы не переданы, показываем список персонажей
     if not args:
-        available_characters = session_manager.get_available_characters()
-        character_list = "Для смены персонажа введите: /character [имя персонажа]\n\nДоступные персонажи:\n"
-        
-        for name, _ in available_characters:
-            character_list += f"• {name}\n"
+        names, _ = _name_index()
+        character_list = "".join(f"• {name}\n" for name in names)
         
-        await update.message.reply_text(character_list)
+        await update.message.reply_text(
+            "Для смены персонажа введите: /character [имя персонажа]\n\nДоступные персонажи:\n"
+            + character_list
+        )
         return
     
     # Соединяем аргументы в полное имя персонажа
     character_name = " ".join(args)
     
     # Меняем персонажа
-    if session_manager.change_character(user_id, character_name):
+    if await asyncio.to_thread(session_manager.change_character, user_id, character_name):
+        _mark_sessions_changed(user_id)
         await update.message.reply_text(f"Теперь вы общаетесь с персонажем {character_name}.")
     else:
-        # Проверяем, может есть персонаж с похожим именем
-        available_characters = session_manager.get_available_characters()
-        character_names = [name for name, _ in available_characters]
-        
         # Пытаемся найти похожее имя (без учета регистра)
-        possible_matches = [name for name in character_names 
-                           if character_name.lower() in name.lower()]
+        names, lowered_names = _name_index()
+        needle = character_name.lower()
+        possible_matches = [names[i] for i, lowered in enumerate(lowered_names) if needle in lowered]
         
         if possible_matches:
             suggestion_text = "Персонаж не найден. Возможно, вы имели в виду:\n"
@@ -204,13 +241,16 @@ async def model_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
     
-    # Меняем модель для агента пользователя
-    agent = session_manager.get_agent_for_user(user_id)
+    # Меняем модель для агента пользователя (под блокировкой пользователя, в рабочем потоке)
     try:
         # Обновляем параметры LLM
-        success = agent.setup_llm(provider_name=provider_name, model_name=model_name)
+        success = await asyncio.to_thread(
+            session_manager.call_with_agent, user_id,
+            lambda agent: agent.setup_llm(provider_name=provider_name, model_name=model_name)
+        )
         
         if success:
+            _mark_sessions_changed(user_id)
             await update.message.reply_text(
                 f"Модель успешно изменена на {provider_name.upper()}/{model_name}."
             )
@@ -226,9 +266,11 @@ async def show_relationship(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Обработчик команды /relationship"""
     user_id = str(update.effective_user.id)
     
-    # Получаем агента и статус отношений
-    agent = session_manager.get_agent_for_user(user_id)
-    relationship_status = agent.get_relationship_status()
+    # Получаем агента и статус отношений в рабочем потоке
+    agent, relationship_status = await asyncio.to_thread(
+        session_manager.call_with_agent, user_id,
+        lambda agent: (agent, agent.get_relationship_status())
+    )
     
     # Форматируем информацию об отношениях
     character_name = agent.character_name
@@ -239,14 +281,7 @@ async def show_relationship(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Аспекты отношений
     relationship_text += "Аспекты отношений:\n"
-    aspects = {
-        "respect": "Уважение",
-        "trust": "Доверие",
-        "liking": "Симпатия",
-        "patience": "Терпение"
-    }
-    
-    for aspect, title in aspects.items():
+    for aspect, title in _ASPECT_TITLES.items():
         value = relationship_status['aspect_values'].get(aspect, 0)
         desc = relationship_status['aspects'].get(aspect, "нейтральное")
         relationship_text += f"• {title}: {desc} ({value:.2f})\n"
@@ -283,11 +318,10 @@ async def relation_change_command(update: Update, context: ContextTypes.DEFAULT_
     aspect = args[0].lower()
     
     # Проверяем корректность аспекта
-    valid_aspects = ["rapport", "respect", "trust", "liking", "patience"]
-    if aspect not in valid_aspects:
+    if aspect not in _VALID_ASPECTS:
         await update.message.reply_text(
             f"Ошибка: неизвестный аспект '{aspect}'.\n"
-            f"Доступные аспекты: {', '.join(valid_aspects)}"
+            f"Доступные аспекты: {', '.join(_ASPECT_NAMES)}"
         )
         return
     
@@ -305,35 +339,32 @@ async def relation_change_command(update: Update, context: ContextTypes.DEFAULT_
         )
         return
     
-    # Получаем агента и обновляем отношения
-    agent = session_manager.get_agent_for_user(user_id)
+    aspect_name = _ASPECT_NAMES.get(aspect, aspect)
+    direction = "улучшено" if change > 0 else "ухудшено"
     
-    try:
-        success = agent.update_relationship_manually(aspect, change)
+    def change_relationship(agent):
+        """Меняет отношение и возвращает новое значение аспекта (None при ошибке)"""
+        if not agent.update_relationship_manually(aspect, change):
+            return None
         
-        aspect_names = {
-            "rapport": "Общее отношение",
-            "respect": "Уважение",
-            "trust": "Доверие",
-            "liking": "Симпатия",
-            "patience": "Терпение"
-        }
+        # Получаем обновленный статус отношений
+        status = agent.get_relationship_status()
         
-        aspect_name = aspect_names.get(aspect, aspect)
+        # Добавляем эпизодическое воспоминание об изменении отношений
+        memory_text = f"[(Cheat)Ручное изменение отношения]: {aspect_name} было {direction} на {abs(change):.2f}"
+        agent.add_episodic_memory(memory_text, importance=0.7, category="отношения")
         
-        if success:
-            # Получаем обновленный статус отношений
-            status = agent.get_relationship_status()
-            new_value = status['rapport_value'] if aspect == 'rapport' else status['aspect_values'].get(aspect, 0)
-            
-            direction = "улучшено" if change > 0 else "ухудшено"
+        return status['rapport_value'] if aspect == 'rapport' else status['aspect_values'].get(aspect, 0)
+    
+    try:
+        # Агент обновляется под блокировкой пользователя в рабочем потоке
+        new_value = await asyncio.to_thread(session_manager.call_with_agent, user_id, change_relationship)
+        
+        if new_value is not None:
+            _mark_sessions_changed(user_id)
             await update.message.reply_text(
                 f"{aspect_name} {direction} на {abs(change):.2f}. Новое значение: {new_value:.2f}"
             )
-            
-            # Добавляем эпизодическое воспоминание об изменении отношений
-            memory_text = f"[(Cheat)Ручное изменение отношения]: {aspect_name} было {direction} на {abs(change):.2f}"
-            agent.add_episodic_memory(memory_text, importance=0.7, category="отношения")
         else:
             await update.message.reply_text(f"Ошибка при изменении отношений.")
     except Exception as e:
@@ -344,20 +375,21 @@ async def memories_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     """Обработчик команды /memories - показывает список эпизодических воспоминаний"""
     user_id = str(update.effective_user.id)
     
-    try:
-        # Получаем агента 
-        agent = session_manager.get_agent_for_user(user_id)
-        
+    def get_memories(agent):
+        """Возвращает агента и его воспоминания, отсортированные по важности"""
         # Получаем список воспоминаний через метод get_episodic_memories
         try:
-            memories = agent.get_episodic_memories(sort_by="importance")
+            return agent, agent.get_episodic_memories(sort_by="importance")
         except Exception as e:
             logger.error(f"Ошибка при получении воспоминаний: {str(e)}")
             # Пробуем получить воспоминания напрямую через memory.episodic_memory
             if hasattr(agent.memory, 'episodic_memory'):
-                memories = agent.memory.episodic_memory.sort(sort_by="importance")
-            else:
-                memories = []
+                return agent, agent.memory.episodic_memory.sort(sort_by="importance")
+            return agent, []
+    
+    try:
+        # Получаем агента и воспоминания в рабочем потоке
+        agent, memories = await asyncio.to_thread(session_manager.call_with_agent, user_id, get_memories)
         
         if not memories:
             await update.message.reply_text(
@@ -369,7 +401,7 @@ async def memories_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             return
         
         # Форматируем список воспоминаний
-        memory_text = f"Эпизодические воспоминания {agent.character_name}\n\n"
+        parts = [f"Эпизодические воспоминания {agent.character_name}", ""]
         
         # Показываем только первые 10 воспоминаний
         show_count = min(10, len(memories))
@@ -387,18 +419,20 @@ async def memories_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             importance = memory.get("importance", 0)
             category = memory.get("category", "без категории")
             
-            memory_text += f"{i+1}. [{timestamp}] {text}\n"
-            memory_text += f"   Важность: {importance:.2f}, Категория: {category}\n\n"
+            parts.append(f"{i+1}. [{timestamp}] {text}")
+            parts.append(f"   Важность: {importance:.2f}, Категория: {category}")
+            parts.append("")
         
         if len(memories) > show_count:
-            memory_text += f"(показано {show_count} из {len(memories)} воспоминаний)\n"
+            parts.append(f"(показано {show_count} из {len(memories)} воспоминаний)")
         
         # Добавляем инструкции по управлению памятью
-        memory_text += "\nКоманды для управления памятью:\n"
-        memory_text += "/memory_add [текст] [важность] - Добавить воспоминание\n"
-        memory_text += "/memory_clear - Очистить всю эпизодическую память"
+        parts.append("")
+        parts.append("Команды для управления памятью:")
+        parts.append("/memory_add [текст] [важность] - Добавить воспоминание")
+        parts.append("/memory_clear - Очистить всю эпизодическую память")
         
-        await update.message.reply_text(memory_text)
+        await update.message.reply_text("\n".join(parts))
     
     except Exception as e:
         logger.error(f"Ошибка при выполнении команды memories: {str(e)}")
@@ -436,13 +470,18 @@ async def memory_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         memory_text = " ".join(args)
         importance = 0.5
     
-    # Получаем агента и добавляем воспоминание
-    agent = session_manager.get_agent_for_user(user_id)
+    def add_memory(agent):
+        """Добавляет воспоминание и возвращает имя персонажа"""
+        agent.add_episodic_memory(memory_text, importance=importance)
+        return agent.character_name
+    
+    # Добавляем воспоминание под блокировкой пользователя в рабочем потоке
     try:
-        idx = agent.add_episodic_memory(memory_text, importance=importance)
+        character_name = await asyncio.to_thread(session_manager.call_with_agent, user_id, add_memory)
+        _mark_sessions_changed(user_id)
         
         await update.message.reply_text(
-            f"Воспоминание успешно добавлено персонажу {agent.character_name} с важностью {importance:.1f}."
+            f"Воспоминание успешно добавлено персонажу {character_name} с важностью {importance:.1f}."
         )
     except Exception as e:
         logger.error(f"Ошибка при добавлении воспоминания: {str(e)}")
@@ -463,13 +502,16 @@ async def memory_clear_confirm_command(update: Update, context: ContextTypes.DEF
     """Обработчик команды /memory_clear_confirm"""
     user_id = str(update.effective_user.id)
     
-    # Получаем агента и очищаем память
-    agent = session_manager.get_agent_for_user(user_id)
+    # Очищаем память под блокировкой пользователя в рабочем потоке
     try:
-        count = agent.clear_episodic_memories()
+        character_name, count = await asyncio.to_thread(
+            session_manager.call_with_agent, user_id,
+            lambda agent: (agent.character_name, agent.clear_episodic_memories())
+        )
+        _mark_sessions_changed(user_id)
         
         await update.message.reply_text(
-            f"Эпизодическая память персонажа {agent.character_name} очищена. Удалено {count} воспоминаний."
+            f"Эпизодическая память персонажа {character_name} очищена. Удалено {count} воспоминаний."
         )
     except Exception as e:
         logger.error(f"Ошибка при очистке памяти: {str(e)}")
@@ -479,32 +521,96 @@ async def save_state(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     """Обработчик команды /save"""
     user_id = str(update.effective_user.id)
     
-    # Получаем агента и сохраняем его состояние
-    agent = session_manager.get_agent_for_user(user_id)
-    try:
+    def save(agent):
+        """Сохраняет состояние агента и возвращает имя персонажа"""
         agent.save_state()
+        return agent.character_name
+    
+    try:
+        # Получение агента и запись на диск выполняются в рабочем потоке,
+        # чтобы не блокировать цикл событий
+        character_name = await asyncio.to_thread(session_manager.call_with_agent, user_id, save)
         
         await update.message.reply_text(
-            f"Состояние персонажа {agent.character_name} успешно сохранено."
+            f"Состояние персонажа {character_name} успешно сохранено."
         )
     except Exception as e:
         logger.error(f"Ошибка при сохранении состояния: {str(e)}")
         await update.message.reply_text(f"Произошла ошибка при сохранении состояния: {str(e)}")
 
-# Добавьте эту новую функцию в ваш telegram_bot.py
-async def keep_typing(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Продолжает показывать статус 'печатает...' пока обрабатывается запрос"""
-    try:
-        while True:
-            await context.bot.send_chat_action(
-                chat_id=chat_id,
-                action='typing'
-            )
-            # Обновляем статус каждые 4 секунды
-            await asyncio.sleep(4)
-    except asyncio.CancelledError:
-        # Задача была отменена, это нормально
-        pass
+# Максимальная длина сообщения Telegram в кодовых единицах UTF-16
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def _utf16_len(text):
+    """Длина строки в кодовых единицах UTF-16 (символы вне BMP, например эмодзи, занимают две)"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+def _split_for_telegram(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Разбивает текст на части, укладывающиеся в лимит длины сообщения Telegram
+    
+    Args:
+        text (str): Текст сообщения
+        limit (int): Максимальная длина части в кодовых единицах UTF-16
+        
+    Yields:
+        str: Части текста; по возможности разрез делается по переводу строки
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + limit, length)
+        
+        # Символы вне BMP занимают по две единицы UTF-16: укорачиваем часть до лимита
+        if _utf16_len(text[start:end]) > limit:
+            units = 0
+            end = start
+            while units + (2 if ord(text[end]) > 0xFFFF else 1) <= limit:
+                units += 2 if ord(text[end]) > 0xFFFF else 1
+                end += 1
+        
+        if end < length:
+            # Перевод строки в начале окна дал бы слишком короткую часть
+            newline = text.rfind("\n", start, end)
+            if newline > start + (end - start) // 2:
+                yield text[start:newline]
+                start = newline + 1
+                continue
+        
+        yield text[start:end]
+        start = end
+
+# Чаты, в которых сейчас готовится ответ: chat_id -> число запросов в обработке
+_active_typing = {}
+
+# Интервал обновления статуса "печатает..." (Telegram сбрасывает его примерно через 5 секунд)
+TYPING_INTERVAL = 4
+
+# Максимальное время ожидания ответа персонажа, секунды
+RESPONSE_TIMEOUT = 90
+
+# Задержка перед сохранением после изменений, секунды
+SAVE_DEBOUNCE = 60
+
+# Событие "есть несохраненные изменения"; создается в post_init внутри цикла событий бота
+_save_event = None
+
+# Пользователи, чьи сессии изменились с последнего сохранения
+_changed_users = set()
+
+async def typing_scheduler(application: Application) -> None:
+    """Один общий цикл, показывающий статус 'печатает...' во всех чатах с запросами в обработке"""
+    while True:
+        await asyncio.sleep(TYPING_INTERVAL)
+        if not _active_typing:
+            continue
+        await asyncio.gather(
+            *(application.bot.send_chat_action(chat_id=chat_id, action='typing')
+              for chat_id in list(_active_typing)),
+            return_exceptions=True
+        )
 
 # Измените функцию handle_message на следующую:
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -515,57 +621,97 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Показываем статус "печатает..." и сохраняем сообщение в переменную
     message = await update.message.reply_text("Обдумываю ответ...")
     
-    # Показываем статус "печатает..." продолжительное время
-    typing_task = asyncio.create_task(keep_typing(update.effective_chat.id, context))
+    # Показываем статус "печатает..." продолжительное время: чат обслуживает общий typing_scheduler
+    chat_id = update.effective_chat.id
+    _active_typing[chat_id] = _active_typing.get(chat_id, 0) + 1
     
     try:
-        # Получаем ответ от персонажа
-        response = session_manager.process_message(user_id, message_text)
+        # Первый запрос в чате показывает статус сразу, планировщик его только продлевает
+        if _active_typing[chat_id] == 1:
+            try:
+                await context.bot.send_chat_action(chat_id=chat_id, action='typing')
+            except Exception as e:
+                logger.warning(f"Не удалось отправить статус 'печатает...': {str(e)}")
         
-        # Отменяем задачу с "печатает..."
-        typing_task.cancel()
+        # Получаем ответ от персонажа в рабочем потоке менеджера сессий,
+        # чтобы загрузка агента и запрос к LLM не блокировали цикл событий
+        response = await asyncio.wait_for(
+            asyncio.wrap_future(session_manager.submit_message(user_id, message_text)),
+            timeout=RESPONSE_TIMEOUT
+        )
         
         # Отправляем ответ по частям, если он слишком длинный
-        if len(response) > 4000:
+        chunks = _split_for_telegram(response)
+        first_chunk = next(chunks, response)
+        second_chunk = next(chunks, None)
+        if second_chunk is None:
+            # Редактируем предыдущее сообщение вместо отправки нового
+            await message.edit_text(first_chunk)
+        else:
             # Удаляем сообщение "Обдумываю ответ..."
             await message.delete()
             
-            chunks = [response[i:i+4000] for i in range(0, len(response), 4000)]
-            for chunk in chunks:
-                await update.message.reply_text(chunk)
-        else:
-            # Редактируем предыдущее сообщение вместо отправки нового
-            await message.edit_text(response)
+            # Части отправляются последовательно: при параллельной отправке
+            # Telegram не гарантирует порядок сообщений
+            for chunk in chain((first_chunk, second_chunk), chunks):
+                await context.bot.send_message(chat_id=chat_id, text=chunk)
+        
+        _mark_sessions_changed(user_id)
         
     except asyncio.TimeoutError:
-        # Отменяем задачу с "печатает..."
-        typing_task.cancel()
         await message.edit_text(
             "Извините, я слишком долго думал над ответом. Пожалуйста, повторите запрос или попробуйте сформулировать короче."
         )
     except Exception as e:
-        # Отменяем задачу с "печатает..."
-        typing_task.cancel()
         logger.error(f"Ошибка при обработке сообщения: {str(e)}")
         await message.edit_text(
             f"Произошла ошибка при обработке вашего сообщения: {str(e)}"
         )
+    finally:
+        # Чат перестает получать статус "печатает...", когда в нем не осталось запросов
+        remaining = _active_typing.get(chat_id, 1) - 1
+        if remaining > 0:
+            _active_typing[chat_id] = remaining
+        else:
+            _active_typing.pop(chat_id, None)
+
+def _mark_sessions_changed(user_id: str) -> None:
+    """Сообщает periodic_save, что сессия пользователя изменилась и ее нужно сохранить"""
+    _changed_users.add(user_id)
+    if _save_event is not None:
+        _save_event.set()
 
 async def periodic_save() -> None:
-    """Периодическое сохранение всех сессий"""
+    """Сохранение измененных сессий (с задержкой); сессии без изменений не сохраняются"""
     while True:
-        await asyncio.sleep(600)  # 10 минут
+        await _save_event.wait()
+        # Изменения, пришедшие за время задержки, сохраняются одним проходом
+        await asyncio.sleep(SAVE_DEBOUNCE)
+        _save_event.clear()
+        user_ids = set(_changed_users)
+        _changed_users.clear()
         try:
-            session_manager.save_all_sessions()
-            logger.info("Выполнено периодическое сохранение сессий")
+            await asyncio.to_thread(session_manager.save_sessions, user_ids)
+            logger.info(f"Выполнено периодическое сохранение сессий ({len(user_ids)})")
         except Exception as e:
             logger.error(f"Ошибка при периодическом сохранении: {str(e)}")
 
 async def post_init(application: Application) -> None:
-    """Запуск периодического сохранения после инициализации приложения"""
+    """Запуск периодического сохранения и статуса 'печатает...' после инициализации приложения"""
+    global _save_event
+    _save_event = asyncio.Event()
     application.create_task(periodic_save())
+    application.create_task(typing_scheduler(application))
     logger.info("Запланировано периодическое сохранение сессий")
 
+async def post_shutdown(application: Application) -> None:
+    """Сохранение отложенных изменений сессий при остановке бота"""
+    if _changed_users:
+        await asyncio.to_thread(session_manager.save_sessions, set(_changed_users))
+        _changed_users.clear()
+    session_manager.close()
+    logger.info("Сохранены изменения активных сессий перед остановкой")
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик ошибок"""
     logger.error(f"Ошибка при обработке обновления {update}: {context.error}")
@@ -579,8 +725,12 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 def main() -> None:
     """Запуск бота"""
+    # Цикл событий на libuv быстрее стандартного при большом числе сетевых запросов
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     # Создаем приложение
-    application = Application.builder().token(TOKEN).post_init(post_init).connect_timeout(30).read_timeout(60).write_timeout(30).build()
+    application = Application.builder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown).connect_timeout(30).read_timeout(60).write_timeout(30).build()
     
     # Добавляем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -0,0 +1,128 @@
+# tests/test_memory_persistence.py
+
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from memory.vector_index import VectorIndex
+
+
+def _fake_encode(self, texts, **kwargs):
+    """Детерминированные нормализованные эмбеддинги без загрузки модели"""
+    vectors = np.stack([
+        np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(16).astype(np.float32)
+        for text in texts
+    ])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(autouse=True)
+def fake_encoder(monkeypatch):
+    monkeypatch.setattr(VectorIndex, "_encode", _fake_encode)
+
+
+def test_save_over_memory_mapped_index(tmp_path):
+    """Загрузка с mmap -> добавление -> сохранение в ту же директорию -> повторная загрузка"""
+    episodic = [f"воспоминание {i}" for i in range(400)]
+
+    original = VectorIndex()
+    original.create_index("episodic", episodic)
+    original.create_index("facts", ["факт 1", "факт 2"])
+    original.save(str(tmp_path))
+
+    loaded = VectorIndex()
+    assert loaded.load(str(tmp_path), mmap=True)
+    loaded.update_index("episodic", ["новое воспоминание"])
+    loaded.save(str(tmp_path))
+
+    reloaded = VectorIndex()
+    assert reloaded.load(str(tmp_path), mmap=True)
+    assert list(reloaded.texts["episodic"]) == episodic + ["новое воспоминание"]
+    assert reloaded.indexes["episodic"].ntotal == len(episodic) + 1
+    assert list(reloaded.texts["facts"]) == ["факт 1", "факт 2"]
+
+    results = reloaded.search("episodic", "новое воспоминание", top_k=1, min_relevance=0.0)
+    assert results[0]["text"] == "новое воспоминание"
+
+
+def test_save_writes_only_changed_indexes(tmp_path):
+    """Повторное сохранение перезаписывает только измененные индексы"""
+    index = VectorIndex()
+    index.create_index("episodic", ["a", "b"])
+    index.create_index("facts", ["факт"])
+    index.save(str(tmp_path))
+
+    facts_mtime = (tmp_path / "facts.faiss").stat().st_mtime_ns
+    (tmp_path / "episodic.faiss").unlink()
+    index.update_index("episodic", ["c"])
+    index.save(str(tmp_path))
+
+    assert (tmp_path / "episodic.faiss").exists()
+    assert (tmp_path / "facts.faiss").stat().st_mtime_ns == facts_mtime
+
+    reloaded = VectorIndex()
+    assert reloaded.load(str(tmp_path))
+    assert list(reloaded.texts["episodic"]) == ["a", "b", "c"]
+    assert list(reloaded.texts["facts"]) == ["факт"]
+
+
+def test_inconsistent_files_are_not_applied(tmp_path):
+    """Несогласованные файлы индекса приводят к ошибке, а не к частично загруженному состоянию"""
+    original = VectorIndex()
+    original.create_index("episodic", ["a", "b", "c"])
+    original.save(str(tmp_path))
+
+    np.save(str(tmp_path / "episodic.npy"), np.zeros((1, 16), dtype=np.float32))
+
+    loaded = VectorIndex()
+    with pytest.raises(ValueError):
+        loaded.load(str(tmp_path))
+    assert loaded.indexes == {}
+
+
+def test_memory_survives_broken_index(tmp_path):
+    """Поврежденные файлы индексов не приводят к потере эпизодической памяти"""
+    from memory.manager import MemoryManager
+
+    file_path = str(tmp_path / "memory.pkl")
+    manager = MemoryManager()
+    manager.add_episodic_memory("Мы говорили о музыке", importance=0.7)
+    manager.save_to_file(file_path)
+
+    index_dir = MemoryManager._index_dir(file_path)
+    with open(f"{index_dir}/episodic.npy", "wb") as f:
+        f.write(b"broken")
+
+    loaded = MemoryManager.load_from_file(file_path)
+    assert loaded.episodic_memory.get_all_texts() == ["Мы говорили о музыке"]
+    assert list(loaded.vector_index.texts["episodic"]) == ["Мы говорили о музыке"]
+
+
+def test_ivfpq_retrained_after_doubling(tmp_path, monkeypatch):
+    """Индекс IVFPQ, выросший более чем вдвое через дописывание, обучается заново"""
+    monkeypatch.setattr(VectorIndex, "MIN_VECTORS", {**VectorIndex.MIN_VECTORS, "ivfpq": 1000})
+    texts = [f"воспоминание {i}" for i in range(2500)]
+
+    index = VectorIndex(index_type="ivfpq")
+    index.rebuild_index("episodic", texts[:1000])
+    assert index._trained_quantizers["episodic"][1] == 1000
+
+    # До удвоения новые векторы дописываются в уже обученный индекс
+    trained = index.indexes["episodic"]
+    index.rebuild_index("episodic", texts[:1500])
+    assert index.indexes["episodic"] is trained
+    assert index._trained_quantizers["episodic"][1] == 1000
+
+    # Размер обучающей выборки сохраняется вместе с индексом
+    index.save(str(tmp_path))
+    loaded = VectorIndex(index_type="ivfpq")
+    assert loaded.load(str(tmp_path))
+    assert loaded._trained_quantizers["episodic"][1] == 1000
+
+    loaded.rebuild_index("episodic", texts)
+    assert loaded._trained_quantizers["episodic"][1] == len(texts)
+    assert loaded.indexes["episodic"].ntotal == len(texts)
+    assert list(loaded.texts["episodic"]) == texts
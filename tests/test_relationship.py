@@ -0,0 +1,153 @@
+# tests/test_relationship.py
+
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import relationship
+from relationship import Relationship, RelationshipHistory
+
+
+def _make_relationship(history_path=None):
+    return Relationship(
+        "Курису",
+        initial_rapport=0.1,
+        initial_aspects={"respect": 0.2, "trust": -0.1, "liking": 0.05, "patience": 0.3},
+        personality_factors={"openness": 0.7, "sensitivity": 0.8},
+        history_path=history_path
+    )
+
+
+def test_round_trip_new_format():
+    """to_dict -> from_dict восстанавливает то же состояние"""
+    original = _make_relationship()
+    original.update_from_interaction("Спасибо, вы гений!", "Рада помочь.")
+    original.update_from_interaction("Ты дурак и идиот, заткнись", "Как грубо.")
+
+    restored = Relationship.from_dict(original.to_dict())
+
+    assert restored.to_dict() == original.to_dict()
+    assert restored.rapport == original.rapport
+    assert restored.aspects == original.aspects
+    assert list(restored.history) == list(original.history)
+
+
+def test_round_trip_old_format():
+    """Старый формат: аспекты числами, записи истории со словарем аспектов"""
+    old_data = {
+        "character_name": "Курису",
+        "rapport": 0.25,
+        "aspects": {"respect": 0.4, "trust": 0.2, "liking": 0.1, "patience": 0.3},
+        "personality_factors": {"openness": 0.6},
+        "history": [
+            {
+                "timestamp": 1700000000.0,
+                "datetime": "2023-11-14T22:13:20",
+                "reason": "Начальное состояние",
+                "rapport": 0.25,
+                "aspects": {"respect": 0.4, "trust": 0.2, "liking": 0.1, "patience": 0.3},
+                "change_magnitude": 0.0
+            }
+        ],
+        "created_at": 1700000000.0,
+        "last_updated": 1700000000.0
+    }
+
+    restored = Relationship.from_dict(old_data)
+
+    assert restored.rapport == 0.25
+    assert restored.aspects == old_data["aspects"]
+    assert restored.history[-1]["aspects"] == (0.4, 0.2, 0.1, 0.3)
+
+    # Повторное сохранение идет уже в новом формате и читается без потерь
+    again = Relationship.from_dict(restored.to_dict())
+    assert again.to_dict() == restored.to_dict()
+    assert again.to_dict()["aspects"]["trust"]["value"] == 0.2
+
+
+def test_round_trip_with_history_file(tmp_path):
+    """История в файле: после загрузки в памяти последние записи из файла"""
+    history_path = str(tmp_path / "relationship_history.jsonl")
+    original = _make_relationship(history_path)
+    for _ in range(Relationship.HISTORY_TAIL + 2):
+        original.update_from_interaction("Ты дурак и идиот, заткнись", "Как грубо.")
+    assert len(original.history) == Relationship.HISTORY_TAIL
+
+    restored = Relationship.loads(original.dumps(), history_path=history_path)
+
+    assert restored.rapport == original.rapport
+    assert list(restored.history) == list(original.history)
+
+
+def test_batch_update_matches_sequential(monkeypatch):
+    """Пакетное обновление дает тот же результат, что и последовательные вызовы"""
+    monkeypatch.setattr(relationship, "time", SimpleNamespace(time=lambda: 1700000000.0))
+    pairs = [
+        ("Спасибо, вы гений!", "Рада помочь."),
+        ("Ты дурак и идиот, заткнись", "Как грубо."),
+        ("", ""),
+        ("Курису, расскажи шутку", "Ха-ха, очень смешно."),
+        ("Извините, я был неправ", "Ничего страшного."),
+    ] * 3
+
+    sequential = _make_relationship()
+    batched = _make_relationship()
+
+    expected = [sequential.update_from_interaction(user, response) for user, response in pairs]
+    results = batched.batch_update_from_interactions(pairs)
+
+    assert len(results) == len(expected)
+    for result, reference in zip(results, expected):
+        assert result["reason"] == reference["reason"]
+        assert result["new_rapport"] == pytest.approx(reference["new_rapport"], abs=1e-12)
+        assert result["aspect_changes"] == pytest.approx(reference["aspect_changes"], abs=1e-12)
+    assert batched.aspects == pytest.approx(sequential.aspects, abs=1e-12)
+    assert len(batched.history) == len(sequential.history)
+
+
+def test_history_ring_buffer_wraparound():
+    """При переполнении вытесняются самые старые записи, порядок сохраняется"""
+    history = RelationshipHistory(3)
+    for i in range(7):
+        history.append(float(i), f"причина {i}", i / 10, (i, i, i, i), i / 100)
+
+    assert len(history) == 3
+    assert [entry["timestamp"] for entry in history] == [4.0, 5.0, 6.0]
+    assert history[0]["reason"] == "причина 4"
+    assert history[-1] == {
+        "timestamp": 6.0,
+        "reason": "причина 6",
+        "rapport": 0.6,
+        "aspects": (6.0, 6.0, 6.0, 6.0),
+        "change_magnitude": 0.06
+    }
+    with pytest.raises(IndexError):
+        history[3]
+
+
+def test_history_ring_buffer_partial():
+    """До заполнения буфер хранит все записи"""
+    history = RelationshipHistory(5)
+    history.extend({"timestamp": float(i), "reason": str(i)} for i in range(2))
+
+    assert len(history) == 2
+    assert [entry["reason"] for entry in history] == ["0", "1"]
+    assert history[-2]["aspects"] == (0.0, 0.0, 0.0, 0.0)
+
+
+def test_status_description_is_a_copy():
+    """Изменение возвращенного описания статуса не портит кэш"""
+    relationship_ = _make_relationship()
+    relationship_.update_from_interaction("Спасибо, вы гений!", "Рада помочь.")
+
+    status = relationship_.get_status_description()
+    expected = relationship_.get_status_description()
+    status["overall"] = None
+    status["aspects"].clear()
+    status["aspect_values"]["trust"] = 1.0
+    if status["last_change"]:
+        status["last_change"]["reason"] = None
+
+    assert relationship_.get_status_description() == expected